@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+from os import path as os_path
+from os import makedirs, chmod, replace as os_replace, remove as os_remove, link as os_link
+from hashlib import sha256
+from threading import Lock
+from shutil import copyfile, copyfileobj
+from tempfile import mkstemp
+from json import dump as jdump
+from json import load as jload
+
+class BlobStore:
+	'Content-addressed store of media files (SHA-256), shared by all jobs using the same directory'
+
+	DIRNAME = 'somedo_blobs'	# created in the parent directory of the output directories
+	CHUNK = 1024 * 1024	# bytes to read at once when hashing files
+	STORES = dict()	# one object per directory, so parallel jobs share the url cache
+	STORES_LOCK = Lock()
+
+	@classmethod
+	def get(cls, rootdir):
+		'Give the store under rootdir, create it if needed'
+		blobdir = os_path.join(rootdir, cls.DIRNAME)
+		with cls.STORES_LOCK:
+			if not blobdir in cls.STORES:
+				cls.STORES[blobdir] = cls(blobdir)
+			return cls.STORES[blobdir]
+
+	def __init__(self, blobdir):
+		'Create directory and load url cache'
+		self.blobdir = blobdir
+		makedirs(blobdir, exist_ok=True)
+		self.lock = Lock()
+		self.cache_path = os_path.join(blobdir, 'urls.json')
+		try:
+			with open(self.cache_path, 'r', encoding='utf-8') as f:
+				self.urls = jload(f)	# url: sha256
+		except (OSError, ValueError):
+			self.urls = dict()
+		self.changed = False
+
+	def blob_path(self, digest):
+		'Path of the blob with the given hash'
+		return os_path.join(self.blobdir, digest[:2], digest)
+
+	def lookup(self, url):
+		'Give hash of the content of url if it is in the store, None otherwise'
+		with self.lock:
+			digest = self.urls.get(url)
+		if digest != None and os_path.isfile(self.blob_path(digest)):
+			return digest
+		return None
+
+	def add_data(self, data, url=None):
+		'Store bytes, give hash'
+		digest = sha256(data).hexdigest()
+		blob = self.blob_path(digest)
+		if not os_path.isfile(blob):
+			makedirs(os_path.dirname(blob), exist_ok=True)
+			fd, tmp = mkstemp(dir=os_path.dirname(blob), suffix='.tmp')	# unique, other jobs might store the same content right now
+			with open(fd, 'wb') as f:
+				f.write(data)
+			self.__publish__(tmp, blob)
+		self.__remember__(url, digest)
+		return digest
+
+	def add_file(self, path, url=None):
+		'Move file into the store (it is replaced by a link), give hash'
+		digest = sha256()
+		with open(path, 'rb') as f:
+			for chunk in iter(lambda: f.read(self.CHUNK), b''):
+				digest.update(chunk)
+		digest = digest.hexdigest()
+		blob = self.blob_path(digest)
+		if os_path.isfile(blob):	# content is already there
+			os_remove(path)
+		else:
+			makedirs(os_path.dirname(blob), exist_ok=True)
+			try:
+				os_replace(path, blob)
+			except OSError:	# other file system
+				fd, tmp = mkstemp(dir=os_path.dirname(blob), suffix='.tmp')
+				with open(path, 'rb') as source, open(fd, 'wb') as target:
+					copyfileobj(source, target)
+				self.__publish__(tmp, blob)
+				os_remove(path)
+		self.link(digest, path)
+		self.__remember__(url, digest)
+		return digest
+
+	def __publish__(self, tmp, blob):
+		'Move completely written temporary file to the blob - if another writer was faster, the content is the same'
+		chmod(tmp, 0o644)	# mkstemp creates files only the user can read
+		try:
+			os_replace(tmp, blob)
+		except OSError:
+			if not os_path.isfile(blob):
+				raise
+			os_remove(tmp)
+
+	def link(self, digest, path):
+		'Make the blob appear at path as hard link (copy if links are not possible)'
+		try:
+			os_link(self.blob_path(digest), path)
+		except FileExistsError:
+			os_remove(path)
+			os_link(self.blob_path(digest), path)
+		except OSError:
+			copyfile(self.blob_path(digest), path)
+
+	def __remember__(self, url, digest):
+		'Put url into cache'
+		if url == None:
+			return
+		with self.lock:
+			if self.urls.get(url) != digest:
+				self.urls[url] = digest
+				self.changed = True
+
+	def save(self):
+		'Write url cache'
+		with self.lock:
+			if not self.changed:
+				return
+			with open(self.cache_path + '.tmp', 'w', encoding='utf-8') as f:
+				jdump(self.urls, f)
+			os_replace(self.cache_path + '.tmp', self.cache_path)
+			self.changed = False
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+from time import perf_counter
+from json import loads as jloads
+from json import dumps as jdumps
+from threading import Thread, Lock, Condition
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from collections import deque
+from websocket import create_connection, WebSocketConnectionClosedException
+
+class CDP:
+	'Multiplexed connection to the Chrome DevTools Protocol'
+
+	DEFAULT_TIMEOUT = 60	# seconds to wait for the response to a command
+	EVENT_BUFFER = 1000	# max. number of buffered events per event method
+
+	def __init__(self, url, logger, timeout=DEFAULT_TIMEOUT, buffer=EVENT_BUFFER, recorder=None):
+		'Connect to websocket and start reader thread - a Recorder (base.replay) logs all messages'
+		self.logger = logger
+		self.timeout = timeout
+		self.buffer = buffer
+		self.recorder = recorder
+		self.conn = create_connection(url, timeout=None)
+		if self.recorder != None:
+			self.recorder.connect(url)
+		self.send_lock = Lock()	# websocket frames must not interleave
+		self.lock = Condition()	# guards the following data and signals new events
+		self.request_id = 0
+		self.pending = dict()	# futures of commands in flight by id
+		self.events = dict()	# buffered events by session and method (only subscribed methods)
+		self.listeners = dict()	# callbacks by session and event method
+		self.closed = False
+		self.reader = Thread(target=self.__reader__, daemon=True)
+		self.reader.start()
+
+	def __reader__(self):
+		'Receive messages and route replies to futures, events to buffers and listeners'
+		while not self.closed:
+			try:
+				message = jloads(self.conn.recv())
+			except (WebSocketConnectionClosedException, OSError, ValueError):
+				break
+			if self.recorder != None:
+				self.recorder.record('in', message)
+			if 'id' in message:
+				with self.lock:
+					future = self.pending.pop(message['id'], None)
+				if future != None and not future.done():
+					future.set_result(message)
+				continue
+			method = message.get('method')
+			key = (message.get('sessionId'), method)
+			with self.lock:
+				if key in self.events:
+					self.events[key].append(message)
+					self.lock.notify_all()
+				listeners = list(self.listeners.get(key, ()))
+			for i in listeners:	# callbacks run on this thread and must not block on replies
+				try:
+					i(message)
+				except Exception as error:
+					self.logger.debug('CDP: listener for %s failed: %s' % (method, error))
+		with self.lock:	# connection is gone, so nobody will answer
+			self.closed = True
+			for i in self.pending.values():
+				if not i.done():
+					i.set_exception(ConnectionError('Connection to Chrome/Chromium closed'))
+			self.pending.clear()
+			self.lock.notify_all()
+
+	def send(self, method, params=None, session_id=None):
+		'Send command without waiting and return a future for the response message'
+		future = Future()
+		with self.lock:
+			if self.closed:
+				raise ConnectionError('Connection to Chrome/Chromium closed')
+			self.request_id += 1
+			future.request_id = self.request_id
+			self.pending[future.request_id] = future
+		message = {'id': future.request_id, 'method': method, 'params': params or {}}
+		if session_id != None:	# command for an attached target (tab)
+			message['sessionId'] = session_id
+		if self.recorder != None:
+			self.recorder.record('out', message)
+		try:
+			with self.send_lock:
+				self.conn.send(jdumps(message))
+		except (WebSocketConnectionClosedException, OSError) as error:
+			with self.lock:
+				self.pending.pop(future.request_id, None)
+			raise ConnectionError('Connection to Chrome/Chromium closed') from error
+		return future
+
+	def wait(self, future, timeout=None):
+		'Wait for the response of a sent command, give None on timeout'
+		if timeout == None:
+			timeout = self.timeout
+		try:
+			return future.result(timeout=timeout)
+		except (FutureTimeoutError, ConnectionError):
+			with self.lock:
+				self.pending.pop(future.request_id, None)
+			return None
+
+	def call(self, method, params=None, timeout=None, session_id=None):
+		'Send command and wait for the response message'
+		return self.wait(self.send(method, params, session_id=session_id), timeout=timeout)
+
+	def call_many(self, cmds, timeout=None, session_id=None):
+		'Pipeline commands given as (method, params) and return the response messages in the same order'
+		futures = [ self.send(i[0], i[1], session_id=session_id) for i in cmds ]
+		if timeout == None:
+			timeout = self.timeout
+		deadline = perf_counter() + timeout
+		return [ self.wait(i, timeout=max(deadline-perf_counter(), 0)) for i in futures ]
+
+	def subscribe(self, *methods, session_id=None):
+		'Start buffering events of the given methods'
+		with self.lock:
+			for i in methods:
+				if not (session_id, i) in self.events:
+					self.events[(session_id, i)] = deque(maxlen=self.buffer)
+
+	def unsubscribe(self, *methods, session_id=None):
+		'Stop buffering events of the given methods and drop the buffered ones'
+		with self.lock:
+			for i in methods:
+				self.events.pop((session_id, i), None)
+
+	def clear_events(self, *methods, session_id=None):
+		'Drop buffered events of the given methods or all of the session if none are given'
+		with self.lock:
+			for i in list(self.events):
+				if i[0] == session_id and (methods == () or i[1] in methods):
+					self.events[i].clear()
+
+	def get_events(self, method, session_id=None):
+		'Take all buffered events of a subscribed method'
+		with self.lock:
+			events = list(self.events.get((session_id, method), ()))
+			if (session_id, method) in self.events:
+				self.events[(session_id, method)].clear()
+		return events
+
+	def wait_event(self, methods, predicate=None, timeout=None, session_id=None):
+		'Wait for and take the first buffered event of the given (subscribed) method(s), give None on timeout'
+		if isinstance(methods, str):
+			methods = (methods,)
+		if timeout == None:
+			timeout = self.timeout
+		deadline = perf_counter() + timeout
+		with self.lock:
+			while True:
+				for i in methods:
+					for j in self.events.get((session_id, i), ()):
+						if predicate == None or predicate(j):
+							self.events[(session_id, i)].remove(j)
+							return j
+				remaining = deadline - perf_counter()
+				if remaining <= 0 or self.closed:
+					return None
+				self.lock.wait(remaining)
+
+	def add_listener(self, method, callback, session_id=None):
+		'Call function on every event of the given method'
+		with self.lock:
+			self.listeners.setdefault((session_id, method), []).append(callback)
+
+	def remove_listener(self, method, callback, session_id=None):
+		'Remove callback given to add_listener'
+		with self.lock:
+			try:
+				self.listeners[(session_id, method)].remove(callback)
+			except (KeyError, ValueError):
+				pass
+
+	def drop_session(self, session_id):
+		'Forget buffers and listeners of a detached session'
+		with self.lock:
+			for i in [ i for i in self.events if i[0] == session_id ]:
+				del self.events[i]
+			for i in [ i for i in self.listeners if i[0] == session_id ]:
+				del self.listeners[i]
+
+	def session(self, session_id):
+		'Give object with the same methods that sends to and receives from one attached target'
+		return CDPSession(self, session_id)
+
+	def is_open(self):
+		'Check if connection is still alive'
+		return not self.closed
+
+	def close(self):
+		'Close websocket, the reader thread exits'
+		self.closed = True
+		try:
+			self.conn.close()
+		except:
+			pass
+
+class CDPSession:
+	'Commands and events of one target attached with flatten=True, sharing the connection of CDP'
+
+	def __init__(self, cdp, session_id):
+		'Create object for the given session'
+		self.connection = cdp
+		self.session_id = session_id
+		self.timeout = cdp.timeout
+
+	def send(self, method, params=None):
+		'Same as CDP.send for this session'
+		return self.connection.send(method, params, session_id=self.session_id)
+
+	def wait(self, future, timeout=None):
+		'Same as CDP.wait for this session'
+		return self.connection.wait(future, timeout=timeout)
+
+	def call(self, method, params=None, timeout=None):
+		'Same as CDP.call for this session'
+		return self.connection.call(method, params, timeout=timeout, session_id=self.session_id)
+
+	def call_many(self, cmds, timeout=None):
+		'Same as CDP.call_many for this session'
+		return self.connection.call_many(cmds, timeout=timeout, session_id=self.session_id)
+
+	def subscribe(self, *methods):
+		'Same as CDP.subscribe for this session'
+		self.connection.subscribe(*methods, session_id=self.session_id)
+
+	def unsubscribe(self, *methods):
+		'Same as CDP.unsubscribe for this session'
+		self.connection.unsubscribe(*methods, session_id=self.session_id)
+
+	def clear_events(self, *methods):
+		'Same as CDP.clear_events for this session'
+		self.connection.clear_events(*methods, session_id=self.session_id)
+
+	def get_events(self, method):
+		'Same as CDP.get_events for this session'
+		return self.connection.get_events(method, session_id=self.session_id)
+
+	def wait_event(self, methods, predicate=None, timeout=None):
+		'Same as CDP.wait_event for this session'
+		return self.connection.wait_event(methods, predicate=predicate, timeout=timeout, session_id=self.session_id)
+
+	def add_listener(self, method, callback):
+		'Same as CDP.add_listener for this session'
+		self.connection.add_listener(method, callback, session_id=self.session_id)
+
+	def remove_listener(self, method, callback):
+		'Same as CDP.remove_listener for this session'
+		self.connection.remove_listener(method, callback, session_id=self.session_id)
+
+	def is_open(self):
+		'Same as CDP.is_open for this session'
+		return self.connection.is_open()
+
+	def close(self):
+		'Detach from target, the connection stays open'
+		try:
+			self.connection.send('Target.detachFromTarget', {'sessionId': self.session_id})
+		except ConnectionError:
+			pass
+		self.connection.drop_session(self.session_id)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+from os import path as os_path
+from os import replace as os_replace
+from os import remove as os_remove
+from threading import Lock
+from tempfile import mkstemp
+from json import dumps as jdumps
+from json import loads as jloads
+
+class Checkpoint:
+	'Progress of a module run as journal file, so a job that has been aborted can go on where it stopped'
+
+	# The first line holds the options and the progress when the file was (re)written, every
+	# further line one change (JSON with "set", "put" and/or "extend"). So a step only appends
+	# its own change, no matter how much progress there is. A torn last line (abort while
+	# writing) is ignored. On resume the journal is compacted into the first line.
+
+	def __init__(self, path, logger, options=None):
+		'Load checkpoint from path - it is only used if it has been written with the same options'
+		self.path = path
+		self.logger = logger
+		self.lock = Lock()	# downloads in background might update
+		self.options = options
+		self.data = dict()
+		self.started = False	# file has been (re)written by this object
+		try:
+			with open(path, 'r', encoding='utf-8') as f:
+				lines = f.read().split('\n')
+			head = jloads(lines[0])
+		except (OSError, ValueError):
+			return
+		if head.get('options') != options:
+			self.logger.info('Checkpoint: options have changed, starting over instead of resuming %s' % path)
+			return
+		self.data = head.get('progress', dict())
+		for i in lines[1:]:
+			try:
+				self.__apply__(jloads(i))
+			except ValueError:	# torn or empty line at the end
+				break
+		self.logger.info('Checkpoint: resuming from %s' % path)
+		with self.lock:
+			self.__rewrite__()
+
+	def resumed(self):
+		'Check if there is progress from an earlier run'
+		return self.data != dict()
+
+	def get(self, key, default=None):
+		'Give value stored under key'
+		with self.lock:
+			return self.data.get(key, default)
+
+	def set(self, key, value):
+		'Store value under key and write checkpoint'
+		self.record(set={key: value})
+
+	def update(self, **kwargs):
+		'Store multiple values at once and write checkpoint'
+		self.record(set=kwargs)
+
+	def append(self, key, value):
+		'Append value to list under key and write checkpoint'
+		self.record(extend={key: [value]})
+
+	def append_all(self, **kwargs):
+		'Append values to the lists under the keys at once and write checkpoint'
+		self.record(extend={ i: [j] for i, j in kwargs.items() })
+
+	def put(self, key, name, value):
+		'Store value under name in the dictionary under key and write checkpoint'
+		self.record(put={key: {name: value}})
+
+	def record(self, set=None, put=None, extend=None):
+		'Apply changes at once and append them to the journal: set values, put into dictionaries, extend lists'
+		change = dict()
+		for i, j in (('set', set), ('put', put), ('extend', extend)):
+			if j != None and j != dict():
+				change[i] = j
+		with self.lock:
+			self.__apply__(change)
+			if not self.started:
+				self.__rewrite__()
+				return
+			with open(self.path, 'a', encoding='utf-8') as f:
+				f.write(jdumps(change, ensure_ascii=False) + '\n')
+
+	def __apply__(self, change):
+		'Apply one change of the journal'
+		self.data.update(change.get('set', dict()))
+		for key, value in change.get('put', dict()).items():
+			self.data.setdefault(key, dict()).update(value)
+		for key, value in change.get('extend', dict()).items():
+			self.data.setdefault(key, []).extend(value)
+
+	def __rewrite__(self):
+		'Write all progress as first line to temporary file and replace, so an abort never leaves a broken checkpoint'
+		fd, tmp = mkstemp(dir=os_path.dirname(self.path), suffix='.tmp')	# unique, so other objects never write into it
+		with open(fd, 'w', encoding='utf-8') as f:
+			f.write(jdumps({'options': self.options, 'progress': self.data}, ensure_ascii=False) + '\n')
+		os_replace(tmp, self.path)
+		self.started = True
+
+	def remove(self):
+		'Remove checkpoint when the work is done, a new run starts from the beginning'
+		with self.lock:
+			self.data = dict()
+			self.started = False
+			try:
+				os_remove(self.path)
+			except OSError:
+				pass
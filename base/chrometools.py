@@ -2,16 +2,24 @@
 
 from os import name as os_name
 from os import path as os_path
-from time import sleep
+from os import replace as os_replace
+from os import remove as os_remove
+from time import sleep, perf_counter
+from threading import Condition, Lock
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from json import loads as jloads
 from json import dumps as jdumps
 from subprocess import Popen
+from tempfile import mkdtemp
+from shutil import rmtree
 from socket import socket, AF_INET, SOCK_STREAM
-from requests import get as rq_get
-from requests import exceptions as rq_exceptions
-from websocket import create_connection
 from base64 import b64decode
 from base.logger import DEBUG
+from base.cdp import CDP
+from base.writer import Writer
+from base.telemetry import Telemetry
 
 class Chrome:
 	'Class around the Chrome/Chromium using the Developers Tools'
@@ -20,10 +28,44 @@ class Chrome:
 	DEFAULT_PAGE_LIMIT = 100	# default limit for page expansion
 	DEFAULT_WINDOW_WIDTH = 1024	# default chrome/chromium window width
 	DEFAULT_WINDOW_HEIGHT = 1280	# default window height
+	DEFAULT_TABS = 4	# default number of tabs working in parallel
+	DEFAULT_CMD_TIMEOUT = 60	# seconds to wait for Chrome/Chromium to answer a command
+	NAV_TIMEOUT = 30	# max. seconds to wait for a page to load
+	NAV_QUIET = 0.5	# seconds without network activity to regard a page as loaded
+	NAV_MAX_INFLIGHT = 2	# number of requests that may still be running (long polling etc.)
+	EXPAND_QUIET = 0.2	# seconds without change of page height to regard expansion as finished
+	EXPAND_TIMEOUT = 500	# max. seconds to wait for a page to stop expanding
+	EXPAND_NET_WAIT = 5	# max. number of quiet periods to wait for the requests of a scroll step before watching the height
+	IMAGE_FORMATS = {'png': 'png', 'jpeg': 'jpg', 'jpg': 'jpg', 'webp': 'webp'}	# format for chrome: file extension
+	DEFAULT_IMAGE_QUALITY = 80	# compression quality for jpeg and webp
+	BLOCK_TYPES = ('Image', 'Media', 'Font')	# resource types not to load in data only mode
+	MEDIA_TYPES = ('Image', 'Media')	# resource types that can be taken from the browser instead of downloading
+	MEDIA_BUFFER = 1000	# max. number of media responses to remember per tab
+	NET_BUFFER = 256 * 1024 * 1024	# bytes of response bodies chrome keeps for getResponseBody
+	NET_RESOURCE_BUFFER = 64 * 1024 * 1024	# max. size of one kept response body
+	CLICK_BUDGET = 500	# max. number of clicks to expand the page per step
+	CLICK_REPEAT = 5	# max. number of clicks on the same element per call (e.g. pager links that stay)
+	CLICK_QUIET = 0.3	# seconds without DOM changes to regard clicked content as loaded
+	CLICK_ROUND = 2	# max. seconds to wait for DOM changes after a round of clicks
+	PDF_CHUNK = 1024 * 1024	# bytes to read at once from the pdf stream
+	TILE_HEIGHT = 4096	# default max. height of one screenshot in tile capture mode
+	BINDING = 'somedoSettled'	# name of the function the page calls to report to python
 
 	def __init__(self, logger, path=None, port=None):
 		'Create object. It is possible to give the path to the Chrome/Chromium.'
 		self.logger = logger
+		self.batch_queue = None	# JavaScript is collected here instead of being sent while a batch is open
+		self.tile_height = 0	# 0 = scroll and take screenshots, > 0 = capture page in tiles of max. this height
+		self.stitch = None	# None or Stitcher for the screenshots taken while scrolling
+		self.writer = Writer(self.logger)	# screenshots are decoded and written in background
+		self.telemetry = Telemetry(self.logger)	# the worker gives a new one to every job
+		self.set_image_format()
+		self.chrome_proc = None
+		self.browser = None
+		self.prewarmed = None	# window size of a browser started in advance
+		self.blocking = None	# resource types and first party hosts on blocked loading
+		self.endpoint = None	# websocket url to connect to instead of starting a browser (e.g. ReplayServer.url)
+		self.recorder = None	# Recorder to log the CDP messages
 		if path == None or path == '':	# set path to chrome/chromium
 			if os_name == 'nt':
 				self.path = 'C:\\Program Files (x86)\\Google\\Chrome\\Application\\chrome.exe'
@@ -38,63 +80,145 @@ class Chrome:
 					if os_path.isfile(i):
 						self.path = i
 						break
+		else:
+			self.path = path
 		if not os_path.isfile(self.path):
 			self.path = None
-		if port == None:	# set port
-			self.port = 9222
-			while self.port <= 10222:
-				with socket(AF_INET, SOCK_STREAM) as so:	# check if port is unused
-					print(so.connect_ex(('localhost', self.port)))
-					if so.connect_ex(('localhost', self.port)) != 0:
-						return
-				self.port += 1
+		if port == None:	# let the kernel assign a free port on launch
+			self.port = 0
 		else:
 			with socket(AF_INET, SOCK_STREAM) as so:	# check if given port is unused
 				if so.connect_ex(('localhost', port)) == 0:
 					raise Exception('Port %d is in use' % port)
 			self.port = port
-			return
-		raise Exception('Could not find an unused port to control Chrome/Chromium')
+		self.port_arg = self.port
 
-	def open(self, window_width=DEFAULT_WINDOW_WIDTH, window_height=DEFAULT_WINDOW_HEIGHT, stop=None):
-		'Open Chrome/Chromium session'
-		if self.is_running():
-			self.close()
+	def __launch__(self, window_width, window_height):
+		'Start Chrome/Chromium process without waiting for it'
+		self.profile = mkdtemp(prefix='somedo_')	# own profile, so several browsers can run at the same time
 		cmd = [	# chrome with parameters
 			self.path,
 			'--window-size=%d,%d' % (window_width, window_height),	# try to set windows dimensions - might not work right now
-			'--remote-debugging-port=%d' % self.port,
+			'--remote-debugging-port=%d' % self.port_arg,	# 0 = chrome gets a free port and writes it to DevToolsActivePort
+			'--user-data-dir=%s' % self.profile,
 			'--incognito',
 			'--disable-gpu'	# might be needed for windows
 		]
-		self.stop = stop	# to abort if user hits the stop button
 		if self.logger.level >= DEBUG:	# start invisble/headless if desired (default)
 			cmd.append('--headless')
 		self.logger.debug('Chrome: cmd: %s' % cmd)
 		self.chrome_proc = Popen(cmd)	# start chrome browser
-		for i in range(100):	# connect to chrome (try 10 seconds before throwing error)
+
+	def prewarm(self, window_width=DEFAULT_WINDOW_WIDTH, window_height=DEFAULT_WINDOW_HEIGHT):
+		'Start browser in advance, the next call of open with the same window size takes it'
+		if self.is_alive() or self.path == None or self.endpoint != None:
+			return
+		try:
+			self.__launch__(window_width, window_height)
+		except OSError as error:	# open will report the problem
+			self.logger.debug('Chrome: could not start browser in advance: %s' % error)
+			return
+		self.prewarmed = (window_width, window_height)
+
+	def __devtools_url__(self, timeout=10):
+		'Wait for Chrome/Chromium to write port and browser websocket path to DevToolsActivePort'
+		path = os_path.join(self.profile, 'DevToolsActivePort')
+		deadline = perf_counter() + timeout
+		while perf_counter() < deadline:
 			try:
-				response = rq_get('http://127.0.0.1:%d/json' % self.port).json()
-				self.conn = create_connection(response[0]['webSocketDebuggerUrl'])
-				self.request_id = 0
-				self.x = 0
-				self.logger.info('%s is running and listening on port %d' % (self.path, self.port))
-				return
-			except rq_exceptions.ConnectionError:
-				sleep(0.1)
+				with open(path, 'r') as f:
+					lines = f.read().split('\n')
+				if len(lines) > 1 and lines[1].startswith('/devtools/'):	# file is complete
+					self.port = int(lines[0])
+					return 'ws://127.0.0.1:%d%s' % (self.port, lines[1])
+			except (OSError, ValueError):
+				pass
+			if self.chrome_proc.poll() != None:
+				break
+			sleep(0.01)
 		raise Exception('Unable to connect to Chrome')
 
+	def open(self, window_width=DEFAULT_WINDOW_WIDTH, window_height=DEFAULT_WINDOW_HEIGHT, stop=None):
+		'Open Chrome/Chromium session'
+		self.stop = stop	# to abort if user hits the stop button
+		if self.endpoint != None:	# no browser to start
+			if self.is_alive():
+				self.close()
+			self.browser = CDP(self.endpoint, self.logger, timeout=self.DEFAULT_CMD_TIMEOUT, recorder=self.recorder)
+			self.__attach__(self.__page_target__())
+			self.logger.info('Connected to %s' % self.endpoint)
+			return
+		if self.prewarmed == (window_width, window_height) and self.is_alive() and self.browser == None:
+			self.logger.debug('Chrome: using browser started in advance')
+		else:
+			if self.is_alive():
+				self.close()
+			self.__launch__(window_width, window_height)
+		self.prewarmed = None
+		self.browser = CDP(self.__devtools_url__(), self.logger, timeout=self.DEFAULT_CMD_TIMEOUT, recorder=self.recorder)
+		self.__attach__(self.__page_target__())
+		self.logger.info('%s is running and listening on port %d' % (self.path, self.port))
+
+	def __page_target__(self):
+		'Get id of the first page (tab) of the browser or create one'
+		for i in range(100):
+			try:
+				for j in self.browser.call('Target.getTargets')['result']['targetInfos']:
+					if j['type'] == 'page':
+						return j['targetId']
+			except (TypeError, KeyError):
+				pass
+			sleep(0.1)
+		return self.browser.call('Target.createTarget', {'url': 'about:blank'})['result']['targetId']
+
+	def __attach__(self, target_id):
+		'Attach to page target and enable events for it'
+		response = self.browser.call('Target.attachToTarget', {'targetId': target_id, 'flatten': True})
+		try:
+			self.cdp = self.browser.session(response['result']['sessionId'])
+		except (TypeError, KeyError):
+			raise Exception('Unable to attach to tab of Chrome/Chromium')
+		self.target_id = target_id
+		self.x = 0
+		self.__enable_events__()
+
+	def new_tab(self):
+		'Open a new tab in the running browser, the Tab object has all the helpers of Chrome'
+		response = self.browser.call('Target.createTarget', {'url': 'about:blank', 'newWindow': True})
+		try:
+			return Tab(self, response['result']['targetId'])
+		except (TypeError, KeyError):
+			raise Exception('Unable to open new tab in Chrome/Chromium')
+
+	def tab_pool(self, size=DEFAULT_TABS):
+		'Create pool of tabs to visit pages in parallel'
+		return TabPool(self, size)
+
 	def close(self):
 		'Close session/browser'
+		self.writer.join()	# finish writing screenshots
+		if self.browser != None:
+			self.browser.close()
+			self.browser = None
+		self.prewarmed = None
+		if self.endpoint != None:	# no process to kill
+			return
 		self.chrome_proc.kill()
 		for i in range(600):
 			if self.chrome_proc.poll() != None:
+				rmtree(self.profile, ignore_errors=True)
 				return
 			sleep(0.1)
 		raise Exception('Unable to close Chrome/Chromium')
 
 	def is_running(self):
-		'Check if Chrome/Chromium is running'
+		'Check if Chrome/Chromium is running and a session is open (a browser started in advance does not count)'
+		return self.is_alive() and self.browser != None
+
+	def is_alive(self):
+		'Check if the Chrome/Chromium process is running (or the connection to endpoint is open)'
+		if self.endpoint != None:
+			return self.browser != None and self.browser.is_open()
 		try:
 			if self.chrome_proc.poll() == None:
 				return True
@@ -102,45 +226,246 @@ class Chrome:
 			pass
 		return False
 
-	def send_cmd(self, method, **kwargs):
-		'Send command to Chrome'
-		self.request_id += 1
-		self.conn.send(jdumps({'method': method, 'id': self.request_id, 'params': kwargs}))	# send command
-		for i in range(100000):	# wait for response
-			message = jloads(self.conn.recv())
-			if message.get('id') == self.request_id:
-				return message
-			if i > 600:
-				sleep(0.1)
-		return None
+	def send_cmd(self, method, cmd_timeout=None, **kwargs):
+		'Send command to Chrome and wait for the response (None on timeout)'
+		start = perf_counter()
+		response = self.cdp.call(method, kwargs, timeout=cmd_timeout)
+		self.telemetry.command(method, perf_counter() - start)
+		return response
+
+	def send_cmds(self, cmds, cmd_timeout=None):
+		'Send commands given as (method, params) at once and wait for all responses'
+		start = perf_counter()
+		responses = self.cdp.call_many(cmds, timeout=cmd_timeout)
+		self.telemetry.command('pipeline', perf_counter() - start)
+		return responses
+
+	def __enable_events__(self):
+		'Enable the domains and events needed to detect when pages are loaded'
+		self.inflight = dict()	# loader ids of running network requests by request id
+		self.frame_id = None	# main frame, set below
+		self.net_activity = perf_counter()	# time of last request start or end
+		self.net_changed = Condition()
+		self.cdp.subscribe(
+			'Page.loadEventFired',
+			'Page.lifecycleEvent',
+			'Page.navigatedWithinDocument',
+			'Page.frameStoppedLoading',
+			'Runtime.bindingCalled',
+			'Runtime.executionContextsCleared'
+		)
+		self.binding_token = 0	# to match reports of the page to requests
+		self.media = OrderedDict()	# request ids of loaded media by url
+		self.cdp.add_listener('Network.requestWillBeSent', self.__request_started__)
+		self.cdp.add_listener('Network.responseReceived', self.__response_received__)
+		for i in ('Network.loadingFinished', 'Network.loadingFailed'):
+			self.cdp.add_listener(i, self.__request_ended__)
+		responses = self.send_cmds([
+			('Page.enable', {}),
+			('Page.setLifecycleEventsEnabled', {'enabled': True}),
+			('Network.enable', {'maxTotalBufferSize': self.NET_BUFFER, 'maxResourceBufferSize': self.NET_RESOURCE_BUFFER}),
+			('Runtime.enable', {}),
+			('Runtime.addBinding', {'name': self.BINDING}),
+			('Page.getFrameTree', {})
+		])
+		try:
+			self.frame_id = responses[-1]['result']['frameTree']['frame']['id']	# main frame
+		except (TypeError, KeyError):
+			self.frame_id = None
+		self.cdp.add_listener('Fetch.requestPaused', self.__request_paused__)
+		if self.blocking != None:	# keep blocking after the browser was restarted
+			self.__fetch_enable__()
+
+	def block_resources(self, types=BLOCK_TYPES, first_party=None):
+		'Do not load the given resource types - with first_party (tuple of domains) also block scripts of other hosts'
+		self.blocking = (tuple(types), first_party)
+		if self.is_running():
+			self.__fetch_enable__()
+
+	def unblock_resources(self):
+		'Load everything again, e.g. for screenshots'
+		self.blocking = None
+		if self.is_running():
+			self.send_cmd('Fetch.disable')
+
+	def __fetch_enable__(self):
+		'Intercept requests of the blocked resource types'
+		patterns = [ {'resourceType': i, 'requestStage': 'Request'} for i in self.blocking[0] ]
+		if self.blocking[1] != None:
+			patterns.append({'resourceType': 'Script', 'requestStage': 'Request'})
+		self.send_cmd('Fetch.enable', patterns=patterns)
+
+	def __request_paused__(self, message):
+		'Listener to let intercepted requests fail - only first party scripts are continued'
+		params = message['params']
+		try:
+			first_party = self.blocking[1]
+			host = params['request']['url'].split('/', 3)[2].split(':', 1)[0]
+		except (TypeError, IndexError):
+			first_party = None
+			host = ''
+		if params.get('resourceType') == 'Script' and (
+			first_party == None or any( host == i or host.endswith('.' + i) for i in first_party )
+		):
+			self.cdp.send('Fetch.continueRequest', {'requestId': params['requestId']})
+		else:
+			self.cdp.send('Fetch.failRequest', {'requestId': params['requestId'], 'errorReason': 'BlockedByClient'})
+
+	def __request_started__(self, message):
+		'Listener to count running network requests - forget the requests of the old document on navigation of the main frame'
+		params = message['params']
+		with self.net_changed:
+			if params.get('type') == 'Document' and params.get('frameId') == self.frame_id and params['requestId'] == params.get('loaderId'):
+				self.inflight = { i: j for i, j in self.inflight.items() if j == params['loaderId'] }	# cancelled requests get no end event
+			self.inflight[params['requestId']] = params.get('loaderId')
+			self.net_activity = perf_counter()
+			self.net_changed.notify_all()
+
+	def __request_ended__(self, message):
+		'Listener to count finished network requests'
+		with self.net_changed:
+			self.inflight.pop(message['params']['requestId'], None)
+			self.net_activity = perf_counter()
+			self.net_changed.notify_all()
+
+	def __response_received__(self, message):
+		'Listener to remember complete media responses, so the bodies can be taken from the browser'
+		params = message['params']
+		if not params.get('type') in self.MEDIA_TYPES or params['response'].get('status') != 200:	# no partial content (video streaming)
+			return
+		with self.net_changed:
+			self.media[params['response']['url']] = params['requestId']
+			self.media.move_to_end(params['response']['url'])
+			while len(self.media) > self.MEDIA_BUFFER:
+				self.media.popitem(last=False)
+
+	def get_media(self, url, timeout=NAV_TIMEOUT):
+		'Give body of a media file the browser has loaded as bytes, None if it is not available'
+		deadline = perf_counter() + timeout
+		with self.net_changed:
+			request_id = self.media.get(url)
+			if request_id == None:
+				return None
+			while request_id in self.inflight:	# body is still loading
+				if perf_counter() >= deadline:
+					return None
+				self.net_changed.wait(deadline - perf_counter())
+		try:
+			result = self.send_cmd('Network.getResponseBody', requestId=request_id)['result']
+			if result['base64Encoded']:
+				data = b64decode(result['body'])
+			else:
+				data = result['body'].encode('utf-8')	# e.g. svg
+		except (TypeError, KeyError, ValueError):	# chrome might have dropped the body from its buffer
+			return None
+		self.telemetry.count('media_from_browser')
+		return data
+
+	def wait_network_idle(self, quiet=NAV_QUIET, timeout=NAV_TIMEOUT, max_inflight=NAV_MAX_INFLIGHT):
+		'Wait until no more than max_inflight requests are running for quiet seconds, give False on timeout'
+		deadline = perf_counter() + timeout
+		with self.net_changed:
+			while True:
+				now = perf_counter()
+				if len(self.inflight) <= max_inflight and now - self.net_activity >= quiet:
+					return True
+				if now >= deadline:
+					return False
+				if len(self.inflight) <= max_inflight:
+					self.net_changed.wait(min(self.net_activity + quiet, deadline) - now)
+				else:
+					self.net_changed.wait(deadline - now)
+
+	def wait_page_load(self, quiet=NAV_QUIET, timeout=NAV_TIMEOUT):
+		'Wait for load event and network idle, give False on timeout'
+		deadline = perf_counter() + timeout
+		event = self.cdp.wait_event(
+			('Page.loadEventFired', 'Page.navigatedWithinDocument', 'Page.lifecycleEvent'),
+			predicate = lambda e: e['method'] != 'Page.lifecycleEvent' or (
+				e['params']['name'] == 'networkIdle' and e['params']['frameId'] == self.frame_id
+			),
+			timeout = timeout
+		)
+		if event == None:
+			self.logger.debug('Chrome: no load event within %s seconds' % timeout)
+			return False
+		if event['method'] == 'Page.lifecycleEvent':	# chrome already regards network as idle
+			return True
+		return self.wait_network_idle(quiet=quiet, timeout=max(deadline-perf_counter(), 0))
 
 	def runtime_eval(self, js):
-		'Send JavaScript code with method Runtume.evaluate to Chrome'
+		'Send JavaScript code with method Runtume.evaluate to Chrome (or queue it while a batch is open)'
+		if self.batch_queue != None:
+			self.batch_queue.append(js)
+			return None
 		message = self.send_cmd('Runtime.evaluate', expression=js)
 		try:
 			return jloads(message['result']['result']['value'])
 		except:
 			return None
 
-	def navigate(self, url):
-		'Go to URL'
+	def batch(self):
+		'Open batch: helpers called inside "with chrome.batch() as b:" are sent as one evaluation, results in b.results'
+		return Batch(self)
+
+	def __no_batch__(self, what):
+		'Raise exception if a batch is open - for helpers that need the result before they can go on'
+		if self.batch_queue != None:
+			raise RuntimeError('Chrome: %s needs the result right away and is not allowed in a batch' % what)
+
+	def run_batch(self, scripts):
+		'Evaluate list of JavaScript snippets in one Runtime.evaluate and give back the list of results'
+		if scripts == []:
+			return []
+		results = self.runtime_eval('''
+			(function(scripts) {
+				var results = new Array();
+				for (var i=0; i<scripts.length; i++) {
+					try { results.push((0, eval)(scripts[i])) }
+					catch(e) { results.push(null) }
+				}
+				return JSON.stringify(results);
+			})(%s)
+		''' % jdumps(scripts))
+		if results == None:
+			return [ None for i in scripts ]
+		decoded = []
+		for i in results:	# same decoding as runtime_eval for every single result
+			try:
+				decoded.append(jloads(i))
+			except:
+				decoded.append(None)
+		return decoded
+
+	def navigate(self, url, quiet=NAV_QUIET, timeout=NAV_TIMEOUT):
+		'Go to URL and wait until page is loaded'
+		self.cdp.clear_events('Page.loadEventFired', 'Page.lifecycleEvent', 'Page.navigatedWithinDocument')
 		self.send_cmd('Page.navigate', url=url)
-		sleep(2)
-		self.wait_expand_end()
+		return self.wait_page_load(quiet=quiet, timeout=timeout)
 
-	def go_back(self):
-		'Go to previous page'
-		self.runtime_eval('window.history.go(-1)')
-		sleep(1)
-		self.wait_expand_end()
+	def go_back(self, quiet=NAV_QUIET, timeout=NAV_TIMEOUT):
+		'Go to previous page and wait until page is loaded'
+		self.cdp.clear_events('Page.loadEventFired', 'Page.lifecycleEvent', 'Page.navigatedWithinDocument')
+		try:
+			history = self.send_cmd('Page.getNavigationHistory')['result']
+			if history['currentIndex'] < 1:	# nothing to go back to
+				return False
+			entry = history['entries'][history['currentIndex']-1]['id']
+		except (TypeError, KeyError, IndexError):
+			return False
+		self.send_cmd('Page.navigateToHistoryEntry', entryId=entry)
+		return self.wait_page_load(quiet=quiet, timeout=timeout)
 
 	def click_elements(self, element_type, selector):
-		'Click all elements by given type and selector'
-		return int(self.runtime_eval('''
+		'Click all elements by given type and selector, give number of clicks (in b.results in a batch)'
+		count = self.runtime_eval('''
 			var elements = document.getElementsBy%s("%s");
 			for (var i=0;i<elements.length; i++) { elements[i].click() }
 			JSON.stringify(elements.length);
-		''' % (element_type, selector)))
+		''' % (element_type, selector))
+		if count == None:	# queued in batch
+			return None
+		return int(count)
 
 	def click_element(self, element_type, selector, n):
 		'Click one elements by given type, selector and number'
@@ -222,59 +547,100 @@ class Chrome:
 		'Set innerHTML of element selected by ID'
 		self.runtime_eval('document.getElementById("%s").innerHTML = "%s"' % (selector, html))
 
-	def get_window_height(self):
-		'Get visible height of the window'
-		for i in range(600):
+	def get_min_int(self, selector, attribute):
+		'Give smallest integer value of attribute in elements matching CSS selector since page load (tracked in the page), None if none'
+		return self.runtime_eval("""
+			(function(selector, attribute) {
+				var key = selector + " " + attribute;
+				window.somedoMin = window.somedoMin || {};
+				if (!(key in window.somedoMin)) {	// install tracker, it lives until the page is left
+					window.somedoMin[key] = null;
+					function update(element) {
+						var value = parseInt(element.getAttribute(attribute));
+						if (!isNaN(value) && (window.somedoMin[key] === null || value < window.somedoMin[key])) {
+							window.somedoMin[key] = value;
+						}
+					}
+					function scan(node) {
+						if (node.nodeType != 1) { return }
+						if (node.matches(selector)) { update(node) }
+						node.querySelectorAll(selector).forEach(update);
+					}
+					scan(document.documentElement);
+					new MutationObserver(function(mutations) {
+						for (var i=0; i<mutations.length; i++) { mutations[i].addedNodes.forEach(scan) }
+					}).observe(document.documentElement, {childList: true, subtree: true});
+				}
+				return JSON.stringify(window.somedoMin[key]);
+			})(%s, %s)
+		""" % (jdumps(selector), jdumps(attribute)))
+
+	def get_new_attributes(self, selector, attribute):
+		'Give values of attribute in elements matching CSS selector that have not been given since page load (seen set in the page)'
+		return self.runtime_eval("""
+			(function(selector, attribute) {
+				var key = selector + " " + attribute;
+				window.somedoSeen = window.somedoSeen || {};
+				var seen = window.somedoSeen[key] = window.somedoSeen[key] || new Set();
+				var values = new Array();
+				document.querySelectorAll(selector).forEach(function(element) {
+					var value = element.getAttribute(attribute);
+					if (value !== null && !seen.has(value)) {
+						seen.add(value);
+						values.push(value);
+					}
+				});
+				return JSON.stringify(values);
+			})(%s, %s)
+		""" % (jdumps(selector), jdumps(attribute)))
+
+	def wait_body(self, timeout=NAV_TIMEOUT):
+		'Wait until the page has a body (one call that returns when DOMContentLoaded fired)'
+		self.send_cmd('Runtime.evaluate',
+			expression = '''
+				new Promise(function(resolve) {
+					if (document.body) { resolve() }
+					else { document.addEventListener("DOMContentLoaded", function() { resolve() }) }
+				})
+			''',
+			awaitPromise = True,
+			cmd_timeout = timeout
+		)
+
+	def __eval_int__(self, js, what):
+		'Evaluate JavaScript that gives an integer, retry when page is not ready'
+		self.__no_batch__('getting the %s' % what)
+		for i in range(10):
 			try:
-				return int(self.runtime_eval('JSON.stringify(window.innerHeight)'))
+				return int(self.runtime_eval('JSON.stringify(%s)' % js))
 			except TypeError:
+				self.wait_body()
 				sleep(0.1)
-		raise Exception('Could not get window height.')
+		raise Exception('Could not get %s.' % what)
+
+	def get_window_height(self):
+		'Get visible height of the window'
+		return self.__eval_int__('window.innerHeight', 'window height')
 
 	def get_window_width(self):
 		'Get visible height of the window'
-		for i in range(600):
-			try:
-				return int(self.runtime_eval('JSON.stringify(window.innerWidth)'))
-			except TypeError:
-				sleep(0.1)
-		raise Exception('Could not get window width.')
+		return self.__eval_int__('window.innerWidth', 'window width')
 
 	def get_page_height(self):
 		'Get page height'
-		for i in range(600):
-			try:
-				return int(self.runtime_eval('JSON.stringify(document.body.scrollHeight)'))
-			except TypeError:
-				sleep(0.1)
-		raise Exception('Could not get page height.')
+		return self.__eval_int__('document.body.scrollHeight', 'page height')
 
 	def get_page_width(self):
 		'Get page width'
-		for i in range(600):
-			try:
-				return int(self.runtime_eval('JSON.stringify(document.body.scrollWidth)'))
-			except TypeError:
-				sleep(0.1)
-		raise Exception('Could not get page width.')
+		return self.__eval_int__('document.body.scrollWidth', 'page width')
 
 	def get_x_position(self):
 		'Get x scroll position'
-		for i in range(600):
-			try:
-				return int(self.runtime_eval('JSON.stringify(document.body.scrollLeft)'))
-			except TypeError:
-				sleep(0.1)
-		raise Exception('Could not get x position.')
+		return self.__eval_int__('document.body.scrollLeft', 'x position')
 
 	def get_y_position(self):
 		'Get y scroll position'
-		for i in range(600):
-			try:
-				return int(self.runtime_eval('JSON.stringify(document.body.scrollTop)'))
-			except TypeError:
-				sleep(0.1)
-		raise Exception('Could not get page y position.')
+		return self.__eval_int__('document.body.scrollTop', 'page y position')
 
 	def set_position(self, y):
 		'Scroll to given position - x has to be stored in object'
@@ -299,6 +665,23 @@ class Chrome:
 		'Calculate scroll height based on the window height'
 		return int(self.get_window_height() * self.SCROLL_RATIO)
 
+	def get_cookies(self):
+		'Get all cookies of the browser'
+		try:
+			return self.send_cmd('Network.getAllCookies')['result']['cookies']
+		except (TypeError, KeyError):
+			return []
+
+	def set_cookies(self, cookies):
+		'Set cookies given as returned by get_cookies'
+		params = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires', 'priority')
+		cookies = [
+			{ j: i[j] for j in params if j in i and not (j == 'expires' and i[j] < 0) }	# no expires for session cookies
+			for i in cookies
+		]
+		response = self.send_cmd('Network.setCookies', cookies=cookies)
+		return response != None and not 'error' in response
+
 	def download(self, url, path):
 		'Download file'
 		self.runtime_eval('''
@@ -312,12 +695,40 @@ class Chrome:
 
 	def page_pdf(self, path_no_ext):
 		'Save page to pdf'
+		if path_no_ext == '':	# no pdf on empty path
+			return
 		if self.logger.level >= DEBUG:
 			try:
-				with open('%s.pdf' % path_no_ext, 'wb') as f:
-					f.write(b64decode(self.send_cmd('Page.printToPDF')['result']['data']))
+				stream = self.send_cmd('Page.printToPDF', transferMode='ReturnAsStream')['result']['stream']
+			except (TypeError, KeyError):
+				return
+			path = '%s.pdf' % path_no_ext
+			tmp = path + '.tmp'	# only a complete pdf replaces the target
+			try:
+				with open(tmp, 'wb') as f:
+					while True:	# read and decode in chunks, so memory does not grow with the page
+						chunk = self.send_cmd('IO.read', handle=stream, size=self.PDF_CHUNK)['result']
+						if chunk.get('base64Encoded'):
+							f.write(b64decode(chunk['data']))
+						else:
+							f.write(chunk['data'].encode('latin-1'))
+						if chunk['eof']:
+							break
+					size = f.tell()
+				os_replace(tmp, path)
+				self.telemetry.count('pdf_bytes', size)
+				self.telemetry.count('pdfs')
 			except:
-				pass
+				self.logger.debug('Chrome: could not save %s' % path)
+				try:
+					os_remove(tmp)	# no truncated pdf
+				except OSError:
+					pass
+			finally:
+				try:
+					self.send_cmd('IO.close', handle=stream)
+				except:
+					pass
 
 	def stop_check(self, terminator=None):
 		'Check if User wants to abort running task'
@@ -333,23 +744,120 @@ class Chrome:
 		except:
 			return False
 
-	def wait_expand_end(self):
-		'Wait for page not expanding anymore'
-		sleep(0.2)
-		old_height = self.get_page_height()
-		for i in range(5000):
-			sleep(0.1)
-			new_height = self.get_page_height()
-			if new_height == old_height:
-				return new_height
-			old_height = new_height
+	def wait_expand_end(self, quiet=EXPAND_QUIET, timeout=EXPAND_TIMEOUT):
+		'Wait for page not expanding anymore - an observer in the page reports when the height has settled'
+		self.__no_batch__('wait_expand_end')
+		self.wait_network_idle(quiet=quiet, timeout=quiet*self.EXPAND_NET_WAIT)	# short, pages with long polling etc. never get idle, the observer decides
+		self.binding_token += 1
+		token = self.binding_token
+		self.cdp.clear_events('Runtime.bindingCalled', 'Runtime.executionContextsCleared')
+		installed = self.runtime_eval('''
+			(function(token, quiet, limit) {
+				var last = -1;
+				var timer = null;
+				var start = Date.now();
+				var mutations = new MutationObserver(check);
+				var resizes = new ResizeObserver(check);
+				function done() {
+					mutations.disconnect();
+					resizes.disconnect();
+					window.%s(JSON.stringify({token: token, height: last}));
+				}
+				function check() {
+					var height = document.body.scrollHeight;
+					if (height == last) { return }
+					last = height;
+					clearTimeout(timer);
+					if (Date.now() - start >= limit) { done() }
+					else { timer = setTimeout(done, quiet) }
+				}
+				mutations.observe(document.body, {childList: true, subtree: true});
+				resizes.observe(document.body);
+				check();
+				return JSON.stringify(true);
+			})(%d, %d, %d)
+		''' % (self.BINDING, token, quiet * 1000, timeout * 1000))
+		if installed == None:	# page without body
+			return self.get_page_height()
+		event = self.cdp.wait_event(
+			('Runtime.bindingCalled', 'Runtime.executionContextsCleared'),
+			predicate = lambda e: e['method'] == 'Runtime.executionContextsCleared' or (
+				e['params']['name'] == self.BINDING and jloads(e['params']['payload'])['token'] == token
+			),
+			timeout = timeout + 1
+		)
+		if event == None or event['method'] == 'Runtime.executionContextsCleared':	# page has been replaced meanwhile
+			return self.get_page_height()
+		return jloads(event['params']['payload'])['height']
+
+	def click_until_stable(self, click_elements_by, budget=CLICK_BUDGET, repeat=CLICK_REPEAT, quiet=CLICK_QUIET, round_timeout=CLICK_ROUND):
+		'Click matching elements in rounds inside the page until no new ones appear, give numbers of clicks and rounds'
+		self.__no_batch__('click_until_stable')
+		message = self.send_cmd('Runtime.evaluate',
+			expression = '''
+				(function(selectors, budget, repeat, quiet, roundTimeout) {
+					var counts = new WeakMap();	// clicks per element in this call, pager links are clicked again on the next scroll step
+					var clicks = 0;
+					var rounds = 0;
+					function matches() {
+						var found = new Set();
+						for (var i=0; i<selectors.length; i++) {
+							var elements;
+							if (selectors[i][0] == "Query") { elements = document.querySelectorAll(selectors[i][1]) }
+							else if (selectors[i][0] == "Id") { elements = [document.getElementById(selectors[i][1])] }
+							else { elements = document["getElementsBy" + selectors[i][0]](selectors[i][1]) }
+							for (var j=0; j<elements.length; j++) {
+								if (elements[j] && (counts.get(elements[j]) || 0) < repeat) { found.add(elements[j]) }
+							}
+						}
+						return Array.from(found);
+					}
+					function settle() {
+						return new Promise(function(resolve) {
+							var timer = null;
+							var limit = setTimeout(finish, roundTimeout);
+							var observer = new MutationObserver(function() {
+								clearTimeout(timer);
+								timer = setTimeout(finish, quiet);
+							});
+							function finish() {
+								observer.disconnect();
+								clearTimeout(timer);
+								clearTimeout(limit);
+								resolve();
+							}
+							observer.observe(document.documentElement, {childList: true, subtree: true});
+						});
+					}
+					function round() {
+						var found = matches();
+						if (found.length == 0 || clicks >= budget) {
+							return JSON.stringify({clicks: clicks, rounds: rounds});
+						}
+						rounds++;
+						for (var i=0; i<found.length && clicks<budget; i++) {
+							counts.set(found[i], (counts.get(found[i]) || 0) + 1);
+							try { found[i].click() } catch(e) {}
+							clicks++;
+						}
+						return settle().then(round);
+					}
+					return Promise.resolve().then(round);
+				})(%s, %d, %d, %d, %d)
+			''' % (jdumps(click_elements_by), budget, repeat, quiet * 1000, round_timeout * 1000),
+			awaitPromise = True,
+			cmd_timeout = self.DEFAULT_CMD_TIMEOUT + budget * round_timeout
+		)
+		try:
+			return jloads(message['result']['result']['value'])
+		except:
+			return None
 
 	def click_page(self, click_elements_by):
-		'Clicking on elements stored in a list of lists: e.g. [["ClassName", "UFIPagerLink"], ["ClassName", "UFICommentLInk"]]'
-		if click_elements_by != None:	# do not click if no elements are given
-			for i in range(5):	# try several times to click on all elements
-				for j in click_elements_by:	# go throught dictionary containing pairs of element type and selector
-					self.click_elements(j[0], j[1])
+		'Expand page by clicking on elements given as [type, selector] pairs, e.g. [["ClassName", "UFIPagerLink"], ["Query", "a.see_more_link"]]'
+		if click_elements_by != None and click_elements_by != []:	# do not click if no elements are given
+			counts = self.click_until_stable(click_elements_by)
+			self.logger.debug('Chrome: expansion clicks: %s' % counts)
 		return self.wait_expand_end()
 
 	def __per_page__(self, per_page_action):
@@ -357,36 +865,83 @@ class Chrome:
 		if per_page_action != None:
 			per_page_action()
 
-	def visible_page_png(self, path_no_ext):
-		'Take screenshot of the visible area of the web page'
+	def visible_page_png(self, path_no_ext, group=None):
+		'Take screenshot of the visible area of the web page - screenshots of a group might be deduped by the writer'
 		if path_no_ext == '':	# no screenshot on empty path
 			return
+		return self.__write_shot__(self.send_cmd('Page.captureScreenshot', **self.shot_params), path_no_ext, group=group)
+
+	def set_image_format(self, image_format='png', quality=DEFAULT_IMAGE_QUALITY, optimize=False):
+		'Set file format (png, jpeg or webp), quality (jpeg and webp) and optimizeForSpeed for screenshots'
+		image_format = image_format.lower()
+		if not image_format in self.IMAGE_FORMATS:
+			raise Exception('Unknown image format %s' % image_format)
+		if image_format == 'jpg':
+			image_format = 'jpeg'
+		self.image_ext = self.IMAGE_FORMATS[image_format]
+		self.shot_params = {'format': image_format}
+		if image_format != 'png':
+			self.shot_params['quality'] = max(0, min(quality, 100))
+		if optimize:
+			self.shot_params['optimizeForSpeed'] = True
+
+	def __write_shot__(self, response, path_no_ext, group=None):
+		'Give screenshot to the background writer'
 		try:
-			with open('%s.png' % path_no_ext, 'wb') as f:
-				f.write(b64decode(self.send_cmd('Page.captureScreenshot', format='png')['result']['data']))
+			future = self.writer.put(response['result']['data'], '%s.%s' % (path_no_ext, self.image_ext), group=group)
 		except:
-			raise Exception('Unable to save visible part of page as PNG')
+			raise Exception('Unable to save screenshot')
+		self.telemetry.count('screenshots')
+		self.telemetry.count('screenshot_bytes', len(response['result']['data']) * 3 // 4)	# decoded size
+		return future
 
-	def entire_page_png(self, path_no_ext):
-		'Take screenshots of the entire page by scrolling through'
+	def get_content_size(self):
+		'Get width and height of the whole page in CSS pixels'
+		metrics = self.send_cmd('Page.getLayoutMetrics')['result']
+		try:
+			size = metrics['cssContentSize']
+		except KeyError:	# older versions of Chrome/Chromium
+			size = metrics['contentSize']
+		return int(size['width']), int(size['height'])
+
+	def entire_page_png(self, path_no_ext, tile_height=None):
+		'Take screenshots of the entire page in tiles without scrolling'
+		if tile_height == None or tile_height < 1:
+			tile_height = self.tile_height if self.tile_height > 0 else self.TILE_HEIGHT
 		self.wait_expand_end()	# do not start while page is still expanding
-		self.set_position(0) 	# go to top of page
-		page_height = self.get_page_height()
-		scroll_height = self.get_scroll_height()
-		if scroll_height >= page_height:	# just one screen
-			self.visible_page_png(path_no_ext)	# store screenshot
-		else:	# multiple screenshots
-			cnt = 1	# counter to number shots
-			for y in range(0, self.get_page_height(), self.get_scroll_height()):
-				self.set_position(y) 	# scroll down
-				self.visible_page_png('%s_%05d' % (path_no_ext, cnt))	# store screenshot
-				cnt += 1	# increase counter
-				if cnt == 100000:	# 99999 screenshots max
-					return
+		page_height = self.get_content_size()[1]	# measure once
+		width = self.get_window_width()
+		if page_height <= tile_height:	# just one tile
+			tiles = [(path_no_ext, 0, max(page_height, 1))]
+		else:
+			tiles = [
+				('%s_%05d' % (path_no_ext, i+1), y, min(tile_height, page_height-y))
+				for i, y in enumerate(range(0, page_height, tile_height))
+			][:99999]	# 99999 screenshots max
+		for i in tiles:
+			self.__write_shot__(self.send_cmd('Page.captureScreenshot',
+				clip = {'x': self.x, 'y': i[1], 'width': width, 'height': i[2], 'scale': 1},
+				captureBeyondViewport = True,
+				**self.shot_params
+			), i[0])
+
+	def __scroll_png__(self, path_no_ext, group, frames):
+		'Take screenshot while scrolling, remember file and scroll position if frames are stitched'
+		if frames != None:
+			frames.append((
+				'%s.%s' % (path_no_ext, self.image_ext),
+				self.__eval_int__('window.scrollY', 'scroll position'),	# might differ from the requested one at the bottom
+				self.visible_page_png(path_no_ext)
+			))
+		else:
+			self.visible_page_png(path_no_ext, group=group)
 
 	def expand_page(self, path_no_ext='', click_elements_by=[], terminator=None, per_page_action=None, limit=DEFAULT_PAGE_LIMIT):
-		'Expand page by scrolling and optional clicking. If path is given, screenshots are taken on the way.'
+		'Expand page by scrolling and optional clicking. If path is given, screenshots are taken on the way or as tiles at the end.'
 		self.terminator = terminator
+		tiles = self.tile_height > 0 and path_no_ext != ''
+		if tiles:	# screenshots are taken after expanding
+			tiles_path, path_no_ext = path_no_ext, ''
 		self.wait_expand_end()	# do not start while page is still expanding
 		scroll_height = self.get_scroll_height()
 		view_height = self.get_window_height()
@@ -394,6 +949,8 @@ class Chrome:
 		old_height = self.get_page_height()	# to check if page is still expanding
 		if limit < 1:
 			limit = 1
+		frames = [] if self.stitch != None and path_no_ext != '' else None	# (file, scroll position, future) to stitch
+		group = path_no_ext if frames == None else None	# writer might dedupe frames if they are not stitched
 		cnt = 0
 		while True:
 			cnt += 1
@@ -411,16 +968,173 @@ class Chrome:
 			new_height = self.wait_expand_end()	# get new height of page when expanding is over
 			y_bottom = old_y + view_height
 			if new_height <= old_height and y_bottom >= new_height:
-				sleep(2)	# wait 2 seconds - page might load some more
+				self.telemetry.sleep(2)	# wait 2 seconds - page might load some more
 				new_height = self.wait_expand_end()
 				if new_height <= old_height and y_bottom >= new_height:	# check again
 					break	# exit
 			if path_no_ext != '':
 				self.set_position(old_y)	# go back to old y in case expanding changed the position
-				self.visible_page_png('%s_%05d' % (path_no_ext, cnt)) # store screenshot
+				self.__scroll_png__('%s_%05d' % (path_no_ext, cnt), group, frames) # store screenshot
 			old_y = new_y
 			old_height = new_height
 		if path_no_ext != '':
 			if cnt > 1:
-				path_no_ext += '_%05d' % cnt
-			self.visible_page_png(path_no_ext) # store screenshot
+				self.__scroll_png__('%s_%05d' % (path_no_ext, cnt), group, frames) # store screenshot
+				self.writer.end_group(path_no_ext)
+				if frames != None:	# crop and stitch in background when the frames are written
+					self.writer.then(
+						[ i[2] for i in frames ],
+						self.stitch.stitch,
+						path_no_ext,
+						[ i[:2] for i in frames ],
+						view_height
+					)
+			else:
+				self.visible_page_png(path_no_ext) # store screenshot
+		if tiles:
+			self.entire_page_png(tiles_path)
+
+class Batch:
+	'Context that collects the JavaScript of the Chrome helpers and sends it at once'
+
+	# Batch safe are the helpers that only evaluate JavaScript: click_element(s), insert_element,
+	# get/set/rm_*_html, get_min_int, get_new_attributes and set_position. They give None and their
+	# results are in b.results in the order of the calls. Helpers that need a result to go on
+	# (get_page_height, get_window_height, set_x_*, wait_expand_end, click_until_stable ...) raise
+	# RuntimeError. Everything else sends CDP commands right away, outside of the batch.
+
+	def __init__(self, chrome):
+		'Create object, nothing is queued until entering the context'
+		self.chrome = chrome
+		self.results = []
+		self.owner = False
+
+	def __enter__(self):
+		'Start queueing - nested batches are merged into the outer one'
+		if self.chrome.batch_queue == None:
+			self.chrome.batch_queue = []
+			self.owner = True
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		'Send the queued JavaScript unless an exception occured'
+		if not self.owner:
+			return False
+		scripts = self.chrome.batch_queue
+		self.chrome.batch_queue = None
+		if exc_type == None:
+			self.results = self.chrome.run_batch(scripts)
+		return False
+
+class Tab(Chrome):
+	'Additional tab of a running Chrome/Chromium with its own session and all the helpers'
+
+	def __init__(self, chrome, target_id):
+		'Attach to the target (tab) and take the settings of the Chrome object'
+		self.logger = chrome.logger
+		self.path = chrome.path
+		self.port = chrome.port
+		self.stop = chrome.stop
+		self.chrome = chrome
+		self.browser = chrome.browser
+		self.writer = chrome.writer	# screenshots of all tabs go through one writer
+		self.telemetry = chrome.telemetry
+		self.tile_height = chrome.tile_height
+		self.stitch = chrome.stitch
+		self.image_ext = chrome.image_ext
+		self.shot_params = chrome.shot_params
+		self.batch_queue = None
+		self.blocking = chrome.blocking
+		self.chrome_proc = chrome.chrome_proc	# attributes of Chrome.__init__ that inherited methods read
+		self.prewarmed = None
+		self.endpoint = chrome.endpoint
+		self.recorder = chrome.recorder
+		self.port_arg = chrome.port_arg
+		self.__attach__(target_id)
+
+	def open(self, *args, **kwargs):
+		'Tabs are opened by Chrome.new_tab'
+		raise Exception('Tab can not start a browser, use Chrome.new_tab')
+
+	def is_running(self):
+		'Check if browser and tab are alive'
+		return self.chrome.is_running() and self.cdp.is_open()
+
+	def is_alive(self):
+		'Check if browser and tab are alive (the process belongs to the Chrome object)'
+		return self.is_running()
+
+	def prewarm(self, *args, **kwargs):
+		'Tabs are opened in a running browser'
+		raise Exception('Tab can not start a browser, use Chrome.new_tab')
+
+	def close(self):
+		'Close tab, the browser keeps running'
+		self.cdp.close()
+		try:
+			self.browser.send('Target.closeTarget', {'targetId': self.target_id})
+		except ConnectionError:
+			pass
+
+class TabPool:
+	'Tabs of one browser to visit pages in parallel'
+
+	def __init__(self, chrome, size=Chrome.DEFAULT_TABS):
+		'Open the tabs'
+		self.chrome = chrome
+		self.logger = chrome.logger
+		self.size = max(size, 1)
+		self.tabs = Queue()
+		for i in range(self.size):
+			self.tabs.put(chrome.new_tab())
+		self.alive = self.size	# tabs that work, the others could not be replaced
+		self.lock = Lock()
+
+	def __run__(self, function, item):
+		'Run function with a free tab, replace tab if anything goes wrong (runs in thread pool)'
+		if self.chrome.stop_check():
+			return None
+		tab = self.tabs.get()
+		if tab == None:	# no working tab left
+			self.tabs.put(None)
+			return None
+		try:
+			return function(tab, item)
+		except Exception as error:
+			self.logger.warning('Chrome: tab failed on %s: %s' % (item, error))
+			try:
+				tab.close()
+			except Exception:
+				pass
+			try:
+				tab = self.chrome.new_tab()	# failures of one tab do not affect the others
+			except Exception as error:
+				self.logger.warning('Chrome: unable to replace tab: %s' % error)
+				tab = None
+			return None
+		finally:
+			if tab != None and tab.is_running():	# only working tabs go back
+				self.tabs.put(tab)
+			else:
+				self.__lost__()
+
+	def __lost__(self):
+		'One tab less - if none is left, put None so waiting items do not block forever'
+		with self.lock:
+			self.alive -= 1
+			if self.alive == 0:
+				for i in range(self.size):
+					self.tabs.put(None)
+
+	def map(self, function, items):
+		'Call function(tab, item) for every item on the tabs in parallel, results in order of the items (None on failure)'
+		with ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='tab') as pool:
+			return list(pool.map(lambda i: self.__run__(function, i), items))
+
+	def close(self):
+		'Close all tabs'
+		while not self.tabs.empty():
+			try:
+				self.tabs.get().close()
+			except Exception:
+				pass
@@ -1,9 +1,9 @@
 #!/usr/bin/python3
 
 from sys import exit as sys_exit
-from base.logger import DEBUG
 from base.storage import Storage
 from base.chrometools import Chrome
+from base.replay import Recorder, ReplayServer
 
 class CLI:
 	'Command Line Interface for Somedo'
@@ -11,6 +11,35 @@ class CLI:
 	def __init__(self, params, worker):
 		'Generate object to parse the command line arguments and execute a job'
 		self.worker = worker
+		speed = 1.0	# timing of replay
+		replay = None
+		while len(params) > 1 and params[0] in (
+			'-p', '-parallel', '--parallel', '--record', '-record', '--replay', '-replay', '--speed', '-speed'
+		):
+			opt = params[0].lstrip('-')
+			if opt in ('p', 'parallel'):	# number of jobs to run at the same time
+				try:
+					self.worker.concurrency = int(params[1])
+				except ValueError:
+					self.__error__('Wrong or missing argument for --parallel / -p.')
+			elif opt == 'record':	# log all CDP messages to file
+				try:
+					self.worker.chrome.recorder = Recorder(params[1])
+				except OSError:
+					self.__error__('Could not write recording to file: %s' % params[1])
+			elif opt == 'replay':	# connect to a replay of a recording instead of starting the browser
+				replay = params[1]
+			else:
+				try:
+					speed = float(params[1])
+				except ValueError:
+					self.__error__('Wrong or missing argument for --speed.')
+			params = params[2:]
+		if replay != None:
+			try:
+				self.worker.chrome.endpoint = ReplayServer(replay, self.worker.logger, speed=speed).url
+			except (OSError, ValueError, KeyError):
+				self.__error__('Could not read recording from file: %s' % replay)
 		if len(params) < 1 or params[0].lower() in ('-h', '-help', 'h', 'help'):
 			for i in ('README.md', 'README.txt', 'README.md.txt', 'README.txt.md', 'README'):
 				try:
@@ -166,14 +195,8 @@ class CLI:
 		if jobs == None:
 			jobs = [self.job]
 		errors = ''
-		for i in jobs:
-			if self.worker.logger.level <= DEBUG:
-				self.worker.execute_job(i)
-			else:
-				try:
-					self.worker.execute_job(i)
-				except Exception as error:
-					errors += str(error) + '\n'
+		for i in self.worker.execute_jobs(jobs):	# worker raises on debug and gives back errors otherwise
+			errors += i + '\n'
 		if errors!= '': 
 			self.__error__(errors)
 		sys_exit(0)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+from os import path as os_path
+from os import replace as os_replace
+from os import remove as os_remove
+from re import match as rmatch
+from re import search as rsearch
+from re import IGNORECASE as RIGNORECASE
+from base64 import b64decode
+from time import sleep
+from hashlib import sha256
+from json import dump as jdump
+from json import load as jload
+from threading import Lock, BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait as futures_wait
+from urllib.parse import urlsplit, urljoin
+from urllib.request import urlretrieve
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+
+class DownloadError(Exception):
+	'Download failed with an HTTP status that is not worth a retry'
+
+class Downloader:
+	'Download files in background threads with keep-alive connections, a limit per host and resumable retries'
+
+	WORKERS = 8	# max. number of downloads at the same time
+	PER_HOST = 4	# max. number of downloads from one host at the same time
+	RETRIES = 3	# number of retries after the first try
+	BACKOFF = 1	# seconds to wait before the first retry, doubled on every further retry
+	TIMEOUT = 30	# seconds for connect and read
+	CHUNK = 64 * 1024	# bytes to read at once
+	MAX_REDIRECTS = 5
+	PART = '.part'	# suffix of unfinished files, kept to resume
+	HEADERS = {	# look like the browser
+		'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36',
+		'Accept': '*/*',
+		'Accept-Encoding': 'identity'
+	}
+
+	def __init__(self, logger, workers=WORKERS, per_host=PER_HOST, retries=RETRIES, backoff=BACKOFF):
+		'Create thread pool, connections are opened on demand'
+		self.logger = logger
+		self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='download')
+		self.per_host = per_host
+		self.retries = retries
+		self.backoff = backoff
+		self.lock = Lock()
+		self.hosts = dict()	# semaphore limiting the downloads per host
+		self.idle = dict()	# idle keep-alive connections by (scheme, host)
+		self.futures = set()
+
+	def put(self, url, path, callback=None, stop=None):
+		'Queue download of url to path, callback(url, path, error, info) is called when done (error is None on success)'
+		with self.lock:
+			future = self.pool.submit(self.__download__, url, path, callback, stop)
+			self.futures.add(future)
+		future.add_done_callback(self.__done__)
+		return future
+
+	def get(self, url, path, stop=None):
+		'Download url to path in the calling thread, give info as dict (size, sha256, resumed), raise exception on failure'
+		return self.__download__(url, path, None, stop)
+
+	def __done__(self, future):
+		'Forget finished download'
+		with self.lock:
+			self.futures.discard(future)
+
+	def join(self):
+		'Wait until all queued downloads are done'
+		while True:
+			with self.lock:
+				futures = list(self.futures)
+			if futures == []:
+				return
+			futures_wait(futures)	# callbacks might have queued more
+
+	def close(self):
+		'Wait for the downloads and close the idle connections'
+		self.join()
+		with self.lock:
+			for i in self.idle.values():
+				for j in i:
+					j.close()
+			self.idle.clear()
+
+	def __download__(self, url, path, callback, stop):
+		'Try to download, retry on network errors and server errors - a retry resumes from the .part file'
+		error = None
+		info = None
+		for attempt in range(self.retries + 1):
+			if attempt > 0:
+				sleep(self.backoff * 2 ** (attempt - 1))
+			try:
+				info = self.__fetch__(url, path, stop)
+				error = None
+				break
+			except DownloadError as e:	# e.g. 404
+				error = e
+				break
+			except (OSError, HTTPException) as e:
+				error = e
+				self.logger.debug('Downloader: try %d for %s failed: %s' % (attempt + 1, url, e))
+		if error != None:
+			self.logger.warning('Downloader: unable to download %s: %s' % (url, error))
+		if callback != None:
+			try:
+				callback(url, path, error, info)
+			except Exception as e:
+				self.logger.warning('Downloader: callback for %s failed: %s' % (url, e))
+		if error != None:
+			raise error
+		return info
+
+	def __fetch__(self, url, path, stop):
+		'Get url into path.part using a pooled connection, resume with a range request, follow redirects, verify and rename'
+		part = path + self.PART
+		for i in range(self.MAX_REDIRECTS + 1):
+			parts = urlsplit(url)
+			if not parts.scheme in ('http', 'https'):	# e.g. file:
+				urlretrieve(url, part)
+				return self.__complete__(part, path, {'total': None, 'sha256': None}, 0)
+			key = (parts.scheme, parts.netloc)
+			with self.lock:
+				semaphore = self.hosts.setdefault(parts.netloc, BoundedSemaphore(self.per_host))
+			with semaphore:
+				state = self.__state__(part)
+				headers = dict(self.HEADERS)
+				if state['offset'] > 0:
+					headers['Range'] = 'bytes=%d-' % state['offset']
+					if state['validator'] != None:	# only resume the same version of the file
+						headers['If-Range'] = state['validator']
+				conn = self.__connection__(key)
+				target = parts.path or '/'
+				if parts.query != '':
+					target += '?' + parts.query
+				result = None
+				try:
+					conn.request('GET', target, headers=headers)
+					response = conn.getresponse()
+					if response.status in (200, 206):
+						result = self.__receive__(response, part, state, stop)
+					else:
+						response.read()	# connection can be reused
+				except (OSError, HTTPException, DownloadError):
+					conn.close()
+					raise
+				self.__release__(key, conn, response)
+			if result != None:
+				return self.__complete__(part, path, result[0], result[1])
+			if response.status == 416 and state['total'] != None and state['offset'] == state['total']:	# part is complete
+				return self.__complete__(part, path, state, state['offset'])
+			if response.status == 416:	# part does not fit the file on the server
+				self.__discard__(part)
+				raise HTTPException('HTTP status 416, starting over')
+			if response.status in (301, 302, 303, 307, 308) and response.getheader('Location') != None:
+				url = urljoin(url, response.getheader('Location'))
+				continue
+			if response.status >= 500 or response.status == 429:	# worth a retry
+				raise HTTPException('HTTP status %d' % response.status)
+			raise DownloadError('HTTP status %d' % response.status)
+		raise DownloadError('Too many redirects')
+
+	def __receive__(self, response, part, state, stop):
+		'Stream body to the part file in chunks, give what is known about the file and the number of resumed bytes'
+		offset = 0
+		total = None
+		if response.status == 206:
+			m = rmatch(r'bytes (\d+)-\d+/(\d+|\*)', response.getheader('Content-Range', ''))
+			if m != None and int(m.group(1)) == state['offset']:
+				offset = state['offset']
+				if m.group(2) != '*':
+					total = int(m.group(2))
+			else:	# unusable range, read it away and start over
+				response.read()
+				self.__discard__(part)
+				raise HTTPException('Unexpected range %s' % response.getheader('Content-Range'))
+		elif response.getheader('Content-Length') != None:
+			total = int(response.getheader('Content-Length'))
+		validator = response.getheader('ETag') or response.getheader('Last-Modified')
+		if validator != None and validator.startswith('W/'):	# weak ETags do not work for ranges
+			validator = None
+		meta = {'total': total, 'validator': validator, 'sha256': self.__digest__(response)}
+		if offset > 0 and meta['sha256'] == None:
+			meta['sha256'] = state['sha256']
+		with open(part + '.json', 'w', encoding='utf-8') as f:	# to resume after an abort or in the next run
+			jdump(meta, f)
+		with open(part, 'r+b' if offset > 0 else 'wb') as f:
+			f.seek(offset)
+			f.truncate()
+			while True:
+				if stop != None and stop.is_set():
+					raise DownloadError('Stopped, %s is kept to resume' % part)
+				chunk = response.read(self.CHUNK)	# bounded buffer
+				if not chunk:
+					break
+				f.write(chunk)
+		return (meta, offset)
+
+	def __state__(self, part):
+		'Give size of the part file and what is known about the file on the server'
+		state = {'offset': 0, 'total': None, 'validator': None, 'sha256': None}
+		try:
+			state['offset'] = os_path.getsize(part)
+			with open(part + '.json', 'r', encoding='utf-8') as f:
+				state.update(jload(f))
+		except (OSError, ValueError):
+			pass
+		if state['offset'] > 0 and state['total'] == None and state['validator'] == None:	# no way to tell if the part still fits
+			state['offset'] = 0
+		return state
+
+	def __digest__(self, response):
+		'Give SHA-256 (hex) the server sends in a Repr-Digest or Digest header, None if there is none'
+		for i in ('Repr-Digest', 'Digest'):
+			m = rsearch(r'sha-256=:?([A-Za-z0-9+/]+=*)', response.getheader(i, ''), RIGNORECASE)
+			if m != None:
+				try:
+					return b64decode(m.group(1)).hex()
+				except ValueError:
+					pass
+		return None
+
+	def __complete__(self, part, path, meta, resumed):
+		'Verify size and hash, then move part to path, give info'
+		size = os_path.getsize(part)
+		if meta['total'] != None and size != meta['total']:	# connection dropped, retry resumes
+			raise HTTPException('Got %d of %d bytes' % (size, meta['total']))
+		digest = sha256()
+		with open(part, 'rb') as f:
+			for chunk in iter(lambda: f.read(self.CHUNK), b''):
+				digest.update(chunk)
+		digest = digest.hexdigest()
+		if meta['sha256'] != None and digest != meta['sha256']:	# corrupt, retry starts over
+			self.__discard__(part)
+			self.__discard__(part + '.json')
+			raise HTTPException('SHA-256 %s does not match %s' % (digest, meta['sha256']))
+		os_replace(part, path)
+		self.__discard__(part + '.json')
+		return {
+			'size': size,
+			'sha256': digest,
+			'resumed': resumed,
+			'verified': 'size+sha256' if meta['sha256'] != None else 'size' if meta['total'] != None else 'none'
+		}
+
+	def __discard__(self, path):
+		'Remove file if it exists'
+		try:
+			os_remove(path)
+		except OSError:
+			pass
+
+	def __connection__(self, key):
+		'Take idle connection to the host or open a new one'
+		with self.lock:
+			try:
+				return self.idle[key].pop()
+			except (KeyError, IndexError):
+				pass
+		if key[0] == 'https':
+			return HTTPSConnection(key[1], timeout=self.TIMEOUT)
+		return HTTPConnection(key[1], timeout=self.TIMEOUT)
+
+	def __release__(self, key, conn, response):
+		'Give connection back for the next download unless the server closes it or the body came short (dead socket)'
+		if response.will_close or (response.length != None and response.length > 0):
+			conn.close()
+			return
+		with self.lock:
+			self.idle.setdefault(key, []).append(conn)
@@ -119,6 +119,11 @@ class GUI(Tk):
 		self.tk_chrome_entry = Entry(frame_row, textvariable=self.tk_chrome, width=self.BIGENTRYWIDTH)
 		self.tk_chrome_entry.pack(side=LEFT)
 		Button(frame_row, text='...', command=self.__chrome__).pack(side=LEFT, padx=self.PADX)
+		frame_row = Frame(frame_nb)
+		frame_row.pack(fill=BOTH, expand=True)
+		Label(frame_row, text='Parallel jobs:', anchor=E, width=self.BUTTONWIDTH).pack(side=LEFT, padx=self.PADX, pady=self.PADY)
+		self.tk_concurrency = IntVar(frame_row, self.worker.concurrency)
+		Entry(frame_row, textvariable=self.tk_concurrency, width=self.INTWIDTH).pack(side=LEFT)
 		self.tk_logins = dict()	# login credentials
 		self.tk_login_entries = dict()
 		for i in self.worker.MODULES:	# notebook tabs for the module configuration
@@ -503,6 +508,10 @@ class GUI(Tk):
 		self.__disable_quitbutton__()
 		self.__enable_messages__()
 		self.__close2stop__()
+		try:
+			self.worker.concurrency = max(self.tk_concurrency.get(), 1)
+		except:
+			self.worker.concurrency = 1
 		self.stop = Event()	# to stop working thread
 		self.stop_set = False
 		self.running_job = 0
@@ -532,14 +541,18 @@ class GUI(Tk):
 	def __worker__(self):
 		'Execute jobs'
 		self.__write_message__('\n--- Executing job(s) ---\n')
-		while self.running_job < len(self.jobs):
-			self.worker.execute_job(self.jobs[self.running_job], stop=self.stop)
-			self.running_job += 1
+		self.worker.execute_jobs(self.jobs, stop=self.stop, started=self.__started__)
+		self.running_job = len(self.jobs)
 		self.__write_message__('\n--- Done ---\n')
 		self.__close2quit__()
 		self.__enable_jobbuttons__()
 		self.__enable_quitbutton__()
 
+	def __started__(self, row):
+		'Called by the worker when a job begins'
+		if not self.stop_set:
+			self.running_job = row
+
 	def __showjob__(self):
 		'Show what the worker is doing'
 		while self.thread_worker.isAlive():
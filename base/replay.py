@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+from time import sleep, perf_counter
+from threading import Thread, Lock, Condition
+from json import loads as jloads
+from json import dumps as jdumps
+from socket import socket, AF_INET, SOCK_STREAM, IPPROTO_TCP, TCP_NODELAY
+from hashlib import sha1
+from base64 import b64encode
+
+class Recorder:
+	'Log all messages of CDP connections with timings to a file (one JSON object per line)'
+
+	def __init__(self, path):
+		'Open file, line buffered so the recording is usable even if Somedo is killed'
+		self.lock = Lock()	# messages come from the reader thread and the threads sending
+		self.file = open(path, 'w', encoding='utf-8', buffering=1)
+		self.start = perf_counter()
+
+	def connect(self, url):
+		'Start a new section, one for every connection to a browser'
+		with self.lock:
+			self.start = perf_counter()
+			self.file.write(jdumps({'t': 0, 'dir': 'open', 'url': url}) + '\n')
+
+	def record(self, direction, message):
+		'Log message given as dictionary, direction is "out" (command) or "in" (response or event)'
+		with self.lock:
+			self.file.write(jdumps({'t': perf_counter() - self.start, 'dir': direction, 'msg': message}) + '\n')
+
+	def close(self):
+		'Close file'
+		with self.lock:
+			self.file.close()
+
+class ReplayServer:
+	'Serve recordings of Recorder over a local websocket - Chrome connects to url instead of starting a browser'
+
+	GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'	# websocket handshake (RFC 6455)
+	WAIT = 10	# max. seconds to wait for the commands a response or event depends on
+
+	def __init__(self, path, logger, speed=1.0, port=0, wait=WAIT):
+		'Load recording and listen - speed 1 replays with real timing, higher is faster, 0 is without delays'
+		self.logger = logger
+		self.speed = speed
+		self.wait = wait
+		self.sections = []	# one list of entries per recorded connection
+		with open(path, 'r', encoding='utf-8') as f:
+			for line in f:
+				if line.strip() == '':
+					continue
+				entry = jloads(line)
+				if entry['dir'] == 'open' or self.sections == []:
+					self.sections.append([])
+				if entry['dir'] != 'open':
+					self.sections[-1].append(entry)
+		self.server = socket(AF_INET, SOCK_STREAM)
+		self.server.bind(('127.0.0.1', port))
+		self.server.listen(4)
+		self.port = self.server.getsockname()[1]
+		self.url = 'ws://127.0.0.1:%d/devtools/browser/replay' % self.port
+		self.served = 0	# number of connections, the n-th one gets the n-th section
+		self.closed = False
+		Thread(target=self.__accept__, daemon=True).start()
+
+	def __accept__(self):
+		'Accept connections and replay the next section to each of them'
+		while not self.closed:
+			try:
+				conn = self.server.accept()[0]
+			except OSError:
+				break
+			conn.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)	# small messages must not wait
+			if self.served < len(self.sections):
+				entries = self.sections[self.served]
+			else:
+				self.logger.warning('Replay: more connections than recorded, replaying nothing')
+				entries = []
+			self.served += 1
+			Thread(target=ReplaySession(self, conn, entries).run, daemon=True).start()
+
+	def close(self):
+		'Stop listening'
+		self.closed = True
+		self.server.close()
+
+class ReplaySession:
+	'Replay one recorded connection: responses are given when the matching command arrives, events in recorded order'
+
+	def __init__(self, server, conn, entries):
+		'Map the recorded commands'
+		self.server = server
+		self.logger = server.logger
+		self.conn = conn
+		self.entries = entries
+		self.send_lock = Lock()
+		self.changed = Condition()	# signals matched commands
+		self.outs = [ i['msg'] for i in entries if i['dir'] == 'out' ]	# recorded commands
+		self.by_id = { j['id']: i for i, j in enumerate(self.outs) }	# recorded command id: index
+		self.live_ids = dict()	# index of recorded command: id sent by the client
+		self.done = 0	# all recorded commands before this index have arrived
+		self.closed = False
+
+	def run(self):
+		'Handshake, then emit the recorded messages'
+		try:
+			self.__handshake__()
+		except (OSError, ValueError) as error:
+			self.logger.warning('Replay: handshake failed: %s' % error)
+			self.conn.close()
+			return
+		Thread(target=self.__reader__, daemon=True).start()
+		outs = 0	# number of recorded commands before the current entry
+		last = 0
+		for entry in self.entries:
+			if entry['dir'] == 'out':
+				outs += 1
+				continue
+			with self.changed:	# wait for the commands the client sent before this message in the recording
+				deadline = perf_counter() + self.server.wait
+				while self.done < outs and not self.closed and perf_counter() < deadline:
+					self.changed.wait(deadline - perf_counter())
+				if self.closed:
+					break
+				if self.done < outs:
+					self.logger.debug('Replay: gave up waiting for %s' % self.outs[self.done]['method'])
+			if self.server.speed > 0:
+				sleep(max(entry['t'] - last, 0) / self.server.speed)
+			last = entry['t']
+			message = entry['msg']
+			if 'id' in message:	# response
+				index = self.by_id.get(message['id'])
+				with self.changed:
+					live_id = self.live_ids.get(index)
+				if live_id == None:	# client did not send this command
+					continue
+				message = dict(message, id=live_id)
+			try:
+				self.__send__(jdumps(message))
+			except OSError:
+				break
+
+	def __reader__(self):
+		'Match commands of the client to the recording, answer unknown ones with an error'
+		while True:
+			try:
+				data = self.__recv__()
+			except OSError:
+				data = None
+			if data == None:
+				break
+			try:
+				message = jloads(data)
+			except ValueError:
+				continue
+			with self.changed:
+				index = None
+				for i in range(self.done, len(self.outs)):	# oldest recorded command of the same method and session not used yet
+					if not i in self.live_ids and self.outs[i]['method'] == message.get('method') and self.outs[i].get('sessionId') == message.get('sessionId'):
+						index = i
+						break
+				if index != None:
+					self.live_ids[index] = message['id']
+					while self.done in self.live_ids:
+						self.done += 1
+					self.changed.notify_all()
+			if index == None:
+				self.logger.debug('Replay: command not in recording: %s' % message.get('method'))
+				reply = {'id': message.get('id'), 'error': {'code': -32000, 'message': 'Not in recording'}}
+				if 'sessionId' in message:
+					reply['sessionId'] = message['sessionId']
+				try:
+					self.__send__(jdumps(reply))
+				except OSError:
+					break
+		with self.changed:
+			self.closed = True
+			self.changed.notify_all()
+		self.conn.close()
+
+	def __handshake__(self):
+		'Read HTTP upgrade request and accept it'
+		request = b''
+		while not b'\r\n\r\n' in request:
+			data = self.conn.recv(4096)
+			if data == b'':
+				raise ValueError('Connection closed during handshake')
+			request += data
+		key = None
+		for line in request.decode('latin-1').split('\r\n'):
+			if line.lower().startswith('sec-websocket-key:'):
+				key = line.split(':', 1)[1].strip()
+		if key == None:
+			raise ValueError('No websocket key')
+		accept = b64encode(sha1((key + ReplayServer.GUID).encode('ascii')).digest()).decode('ascii')
+		self.conn.sendall((
+			'HTTP/1.1 101 Switching Protocols\r\n'
+			'Upgrade: websocket\r\n'
+			'Connection: Upgrade\r\n'
+			'Sec-WebSocket-Accept: %s\r\n\r\n' % accept
+		).encode('ascii'))
+
+	def __read__(self, n):
+		'Read exactly n bytes'
+		data = b''
+		while len(data) < n:
+			chunk = self.conn.recv(n - len(data))
+			if chunk == b'':
+				raise OSError('Connection closed')
+			data += chunk
+		return data
+
+	def __recv__(self):
+		'Read one message (text) from the client, None on close'
+		payload = b''
+		while True:
+			head = self.__read__(2)
+			opcode = head[0] & 0x0f
+			length = head[1] & 0x7f
+			if length == 126:
+				length = int.from_bytes(self.__read__(2), 'big')
+			elif length == 127:
+				length = int.from_bytes(self.__read__(8), 'big')
+			mask = self.__read__(4) if head[1] & 0x80 else b'\x00\x00\x00\x00'
+			data = self.__read__(length)
+			data = (int.from_bytes(data, 'big') ^ int.from_bytes((mask * (length // 4 + 1))[:length], 'big')).to_bytes(length, 'big')
+			if opcode == 8:	# close
+				return None
+			if opcode == 9:	# ping
+				self.__send__(data, opcode=10)
+				continue
+			if opcode == 10:	# pong
+				continue
+			payload += data
+			if head[0] & 0x80:	# final fragment
+				return payload.decode('utf-8')
+
+	def __send__(self, data, opcode=1):
+		'Send one unmasked frame (text by default)'
+		if isinstance(data, str):
+			data = data.encode('utf-8')
+		if len(data) < 126:
+			head = bytes((0x80 | opcode, len(data)))
+		elif len(data) < 65536:
+			head = bytes((0x80 | opcode, 126)) + len(data).to_bytes(2, 'big')
+		else:
+			head = bytes((0x80 | opcode, 127)) + len(data).to_bytes(8, 'big')
+		with self.send_lock:
+			self.conn.sendall(head + data)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+from os import path as os_path
+from os import remove as os_remove
+from json import dump as jdump
+try:	# only needed to stitch frames
+	from PIL import Image, TiffImagePlugin, features
+except ImportError:
+	Image = None
+
+class Stitcher:
+	'Crop screenshots taken while scrolling to the bands they add and store them as one multi-page TIFF with an index'
+
+	MODES = ('keep', 'replace')	# keep the frames or remove them after stitching
+	TILE_HEIGHT = 4096	# max. height of one page of the TIFF in pixels
+
+	def __init__(self, logger, mode='keep', tile_height=TILE_HEIGHT, image_format='png', quality=None):
+		'Create object - image_format and quality of the frames decide how the tiles are compressed'
+		self.logger = logger
+		if not mode in self.MODES:
+			raise Exception('Unknown stitch mode %s' % mode)
+		self.mode = mode
+		self.tile_height = tile_height
+		self.save_params = dict()	# lossless frames stay lossless, lossy frames are not blown up
+		if Image == None:
+			return
+		if image_format == 'png':
+			self.save_params['compression'] = 'tiff_deflate' if features.check('libtiff') else 'packbits'
+		elif features.check('libtiff'):
+			self.save_params['compression'] = 'jpeg'
+			if quality != None:
+				self.save_params['quality'] = quality
+
+	def stitch(self, path_no_ext, frames, view_height):
+		'Stitch frames given as (path, scroll position) to path_no_ext_stitched.tiff and write index to path_no_ext_stitched.json'
+		if Image == None:
+			self.logger.warning('Stitcher: Pillow (PIL) is not installed, frames are kept as they are')
+			return None
+		path = '%s_stitched.tiff' % path_no_ext
+		index = {'file': os_path.basename(path), 'tiles': [], 'frames': []}	# state of this call only, stitch jobs run in parallel
+		bands = []	# bands of the tile that is not written yet
+		end = 0	# page is complete until here (CSS pixels)
+		with TiffImagePlugin.AppendingTiffWriter(path, True) as tiff:	# one tile after the other, so memory stays bounded
+			for frame, y in frames:
+				entry = {'file': os_path.basename(frame), 'y': y}
+				try:
+					image = Image.open(frame)
+					image.load()
+				except OSError as error:	# e.g. frame was not written
+					self.logger.warning('Stitcher: unable to read %s: %s' % (frame, error))
+					entry['missing'] = True
+					index['frames'].append(entry)
+					continue
+				scale = image.height / view_height	# device pixels per CSS pixel
+				top = max(end - y, 0)	# rows already covered by the previous frames
+				if top < view_height:
+					band = image.crop((0, round(top * scale), image.width, image.height)).convert('RGB')
+					if bands != [] and sum( i.height for i in bands ) + band.height > self.tile_height:
+						self.__write_tile__(tiff, bands, index)
+						bands = []
+					if bands == []:
+						index['tiles'].append({'page': len(index['tiles']), 'y': y + top})
+					bands.append(band)
+					entry['crop'] = [top, view_height]	# rows of the frame in the tiff (CSS pixels)
+					entry['band'] = [y + top, y + view_height]	# rows of the page
+					entry['tile'] = len(index['tiles']) - 1
+					end = y + view_height
+				entry['scale'] = scale
+				index['frames'].append(entry)
+				image.close()
+			if bands != []:
+				self.__write_tile__(tiff, bands, index)
+		if index['tiles'] == []:
+			os_remove(path)
+			return None
+		with open('%s_stitched.json' % path_no_ext, 'w', encoding='utf-8') as f:
+			jdump(index, f, indent=1)
+		if self.mode == 'replace':
+			for i in frames:
+				try:
+					os_remove(i[0])
+				except OSError:
+					pass
+		self.logger.debug('Stitcher: %d frames to %s' % (len(frames), path))
+		return path
+
+	def __write_tile__(self, tiff, bands, index):
+		'Paste the collected bands into one image and append it as page to the tiff'
+		tile = Image.new('RGB', (max( i.width for i in bands ), sum( i.height for i in bands )), 'white')
+		y = 0
+		for i in bands:
+			tile.paste(i, (0, y))
+			y += i.height
+		tile.save(tiff, format='TIFF', **self.save_params)
+		tiff.newFrame()
+		index['tiles'][-1]['height'] = tile.height	# device pixels
@@ -4,12 +4,20 @@ from os import name as os_name
 from os import path as os_path
 from os import mkdir as os_mkdir
 from os import getcwd
+from os import open as os_open
+from os import remove as os_remove
+from os import O_WRONLY, O_CREAT, O_TRUNC
+from hashlib import sha256
 from datetime import datetime
 from json import dump as jdump
 from json import load as jload
-from urllib.request import urlretrieve
 from html2text import html2text
 from shutil import copytree
+from threading import Lock
+from concurrent.futures import wait as futures_wait
+from base.blobstore import BlobStore
+from base.downloader import Downloader
+from base.checkpoint import Checkpoint
 
 class Storage:
 	'Save data into destination directory and subdirectories'
@@ -27,8 +35,33 @@ class Storage:
 			self.slash = '/'	# the real slash for real operating systems :-)
 			self.rootdir = os_path.realpath(__file__).rsplit(self.slash, 2)[0]	# set root directory of the application (one level up from here)
 		self.icondir = self.rootdir + self.slash + 'icons'
+		self.sessiondir = self.rootdir + self.slash + 'sessions'	# cookies of the investigator accounts
 		self.outdir = self.workdir + self.slash + self.today() + '_SocialMedia'
 		self.moddir = self.outdir	# output directory
+		self.telemetry = None	# counts written files and bytes if set
+		self.blobs = None	# BlobStore for downloaded media if set
+		self.downloader = Downloader(logger)	# downloads in background, threads are started on demand
+		self.pending = set()	# downloads of this object that are not done yet
+		self.stop = None	# event to abort downloads, the unfinished .part files are kept to resume
+		self.lock = Lock()
+
+	def clone(self):
+		'Give new Storage object with the same output directory, e.g. for a job running in parallel'
+		storage = Storage(self.logger)
+		storage.outdir = self.outdir
+		storage.moddir = self.outdir
+		storage.sessiondir = self.sessiondir
+		storage.blobs = self.blobs
+		storage.downloader = self.downloader	# limit per host counts for all parallel jobs
+		storage.stop = self.stop
+		return storage
+
+	def use_blobs(self, on=True):
+		'Store downloaded media once by content in a directory next to the output directories, the files are hard links'
+		if on:
+			self.blobs = BlobStore.get(os_path.dirname(os_path.abspath(self.outdir)))
+		else:
+			self.blobs = None
 
 	def today(self):
 		'Give date of today as string'
@@ -41,7 +74,8 @@ class Storage:
 		try:
 			os_mkdir(path)
 		except:
-			raise RuntimeError('Could not create directory %s.' % path)
+			if not self.dir_exists(path):	# another job might have been faster
+				raise RuntimeError('Could not create directory %s.' % path)
 		return path
 
 	def file_exists(self, path):
@@ -52,10 +86,17 @@ class Storage:
 		'Check if directory exists'
 		return os_path.isdir(path)
 
+	def __written__(self, path):
+		'Count written file for telemetry'
+		if self.telemetry != None:
+			self.telemetry.count('files')
+			self.telemetry.count('file_bytes', os_path.getsize(path))
+
 	def json_dump(self, json, path):
 		'Write JSON file'
 		with open(path, 'w', encoding='utf-8') as f:
 			jdump(json, f, ensure_ascii=False)
+		self.__written__(path)
 
 	def json_load(self, path):
 		'Load JSON file'
@@ -91,9 +132,11 @@ class Storage:
 		'Make top level output directory'
 		self.mkdir(self.outdir)
 
-	def mkmoddir(self, module):
-		'Make directory for a module such as Facebook'
+	def mkmoddir(self, module, number=1):
+		'Make directory for a module such as Facebook - number > 1 for further jobs of the module gives e.g. Facebook_2'
 		self.mkoutdir()
+		if number > 1:
+			module = '%s_%d' % (module, number)
 		self.moddir = self.mkdir(self.outdir + self.slash + module)
 
 	def mksubdir(self, dirname):
@@ -108,8 +151,10 @@ class Storage:
 
 	def write_str(self, string, *args):
 		'Write string to file from main or subdirectory'
-		with open(self.modpath(*args), 'w', encoding='utf-8') as f:
+		path = self.modpath(*args)
+		with open(path, 'w', encoding='utf-8') as f:
 			f.write(str(string))	# write string
+		self.__written__(path)
 
 	def read_str(self, *args):
 		'Read file as string from main or subdirecoty'
@@ -118,29 +163,36 @@ class Storage:
 
 	def write_xml(self, string, *args):
 		'Write string to file while encoding UTF8 to HTML'
-		with open(self.modpath(*args), 'wb') as f:
+		path = self.modpath(*args)
+		with open(path, 'wb') as f:
 			f.write(string.encode('ascii', 'xmlcharrefreplace'))
+		self.__written__(path)
 
 	def write_1d(self, lst1d, *args):
 		'Write (1-dimensional) list to CSV/TSV file (1 line, tab separated)'
-		with open(self.modpath(*args), 'w', encoding='utf-8') as f:
+		path = self.modpath(*args)
+		with open(path, 'w', encoding='utf-8') as f:
 			line = ''
 			for i in lst1d:	# write list as CSV/TSV (tab stop seperated fields)
 				line += '"%s";' % str(i)
 			f.write(line[:-1] + '\n')
+		self.__written__(path)
 
 	def write_2d(self, lst2d, *args):
 		'Write list of lists (2-dimensinal list) to CSV/TSV file'
-		with open(self.modpath(*args), 'w', encoding='utf-8') as f:
+		path = self.modpath(*args)
+		with open(path, 'w', encoding='utf-8') as f:
 			for i in lst2d:
 				line = ''
 				for j in i:
 					line += '"%s";' % str(j)
 				f.write(line[:-1] + '\n')
+		self.__written__(path)
 
 	def write_dicts(self, dictionary, index, *args):
 		'Write dictionary or list of dictionaries to CSV/TSV file'
-		with open(self.modpath(*args), 'w', encoding='utf-8') as f:
+		path = self.modpath(*args)
+		with open(path, 'w', encoding='utf-8') as f:
 			if isinstance(dictionary, dict):
 				ldicts = [dictionary]
 			else:
@@ -150,6 +202,7 @@ class Storage:
 				for j in index:
 					line += '"%s";' % str(i[j])
 				f.write(line[:-1] + '\n')
+		self.__written__(path)
 
 	def write_json(self, json, *args):
 		'Write data to JSON file'
@@ -157,9 +210,121 @@ class Storage:
 
 	def write_text(self, string, *args):
 		'Convert from html to text and write to file'
-		with open(self.modpath(*args), 'w', encoding='utf-8') as f:
+		path = self.modpath(*args)
+		with open(path, 'w', encoding='utf-8') as f:
 			f.write(html2text(string))
+		self.__written__(path)
+
+	def download(self, url, *args, browser=None):
+		'Write media file - take it from the browser (Chrome or Tab) if loaded there, download otherwise, give info as dict'
+		path = self.modpath(*args)
+		info = self.__local__(url, path, browser)
+		if info != None:
+			return info
+		info = self.downloader.get(url, path, stop=self.stop)
+		self.__downloaded__(path, url, info)
+		return info
+
+	def download_later(self, url, *args, browser=None, callback=None):
+		'Like download, but files the browser does not have are downloaded in background - callback(path, error, info) when done'
+		path = self.modpath(*args)
+		info = self.__local__(url, path, browser)
+		if info != None:
+			if callback != None:
+				callback(path, None, info)
+			return
+		def done(url, path, error, info):
+			if error == None:
+				self.__downloaded__(path, url, info)
+			if callback != None:
+				callback(path, error, info)
+		with self.lock:
+			future = self.downloader.put(url, path, callback=done, stop=self.stop)
+			self.pending.add(future)
+		future.add_done_callback(self.__download_done__)
+
+	def __download_done__(self, future):
+		'Forget finished download'
+		with self.lock:
+			self.pending.discard(future)
 
-	def download(self, url, *args):
-		'Download and writte file'
-		urlretrieve(url, self.modpath(*args))
+	def wait_downloads(self):
+		'Wait until the downloads in background of this object (not the ones of parallel jobs) are done'
+		with self.lock:
+			futures = list(self.pending)
+		futures_wait(futures)
+
+	def __local__(self, url, path, browser):
+		'Write media file from blob store or browser if possible, give info or None if it has to be downloaded'
+		if self.blobs != None:
+			digest = self.blobs.lookup(url)
+			if digest != None:	# same url has been downloaded before
+				self.blobs.link(digest, path)
+				self.__blob__(path, digest, url, 'blob_hits')
+				return {'size': os_path.getsize(path), 'sha256': digest, 'resumed': 0, 'verified': 'blob'}
+		if browser == None:
+			return None
+		data = browser.get_media(url)
+		if data == None:
+			return None
+		info = {'size': len(data), 'sha256': sha256(data).hexdigest(), 'resumed': 0, 'verified': 'browser'}
+		if self.blobs != None:
+			digest = self.blobs.add_data(data, url)
+			self.blobs.link(digest, path)
+			self.__blob__(path, digest, url, 'blob_stored')
+			return info
+		with open(path, 'wb') as f:
+			f.write(data)
+		self.__written__(path)
+		return info
+
+	def __downloaded__(self, path, url, info):
+		'Count downloaded file and move it into the blob store if used'
+		if self.telemetry != None:
+			self.telemetry.count('downloads')
+			if info['resumed'] > 0:
+				self.telemetry.count('downloads_resumed')
+				self.telemetry.count('resumed_bytes', info['resumed'])
+		if self.blobs != None:
+			self.__blob__(path, self.blobs.add_file(path, url), url, 'blob_stored')
+		else:
+			self.__written__(path)
+
+	def __blob__(self, path, digest, url, counter):
+		'Add file that is a link into the blob store to the manifest of the module directory'
+		with self.lock, open(self.modpath('blobs.csv'), 'a', encoding='utf-8') as f:	# downloads finish in parallel
+			f.write('"%s";"%s";"%s"\n' % (path, digest, url))
+		if self.telemetry != None:
+			self.telemetry.count(counter)
+
+	def checkpoint(self, options, *args):
+		'Give checkpoint stored as file under module directory, e.g. for an account'
+		return Checkpoint(self.modpath(*args), self.logger, options=options)
+
+	def checkpoint_name(self, prefix, targets):
+		'Give file name of a checkpoint in the module directory that belongs to the given targets, so jobs do not collide'
+		return '%s_%s.json' % (prefix, sha256('\n'.join(sorted(targets)).encode('utf-8')).hexdigest()[:16])
+
+	def session_path(self, account):
+		'Build path to the session file of an investigator account (name is hashed)'
+		return self.sessiondir + self.slash + sha256(account.encode('utf-8')).hexdigest() + '.json'
+
+	def save_session(self, account, cookies):
+		'Write cookies of an investigator account, only readable by the user'
+		self.mkdir(self.sessiondir)
+		with open(os_open(self.session_path(account), O_WRONLY | O_CREAT | O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+			jdump(cookies, f)
+
+	def load_session(self, account):
+		'Read cookies of an investigator account, None if there is no session'
+		try:
+			return self.json_load(self.session_path(account))
+		except (OSError, ValueError):
+			return None
+
+	def drop_session(self, account):
+		'Remove session file of an investigator account'
+		try:
+			os_remove(self.session_path(account))
+		except OSError:
+			pass
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+from time import sleep, perf_counter
+from threading import Lock
+from bisect import bisect_left
+from functools import wraps
+from json import dump as jdump
+
+class Telemetry:
+	'Collect latencies of commands to the browser, timings of phases and counters of a job'
+
+	BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)	# upper bounds of the latency histograms in seconds
+	TOP = 5	# number of commands and phases in the printed summary
+
+	def __init__(self, logger):
+		'Create empty record, time starts now'
+		self.logger = logger
+		self.lock = Lock()	# commands are sent from several tabs/threads
+		self.start = perf_counter()
+		self.commands = dict()	# by method: count, total and max. seconds, histogram
+		self.phases = dict()	# by name: count, total seconds
+		self.counters = dict()	# e.g. screenshots, bytes written
+
+	def command(self, method, seconds):
+		'Record latency of one command'
+		with self.lock:
+			try:
+				record = self.commands[method]
+			except KeyError:
+				record = self.commands[method] = {'count': 0, 'total': 0.0, 'max': 0.0, 'histogram': [0] * (len(self.BUCKETS) + 1)}
+			record['count'] += 1
+			record['total'] += seconds
+			if seconds > record['max']:
+				record['max'] = seconds
+			record['histogram'][bisect_left(self.BUCKETS, seconds)] += 1
+
+	def phase_time(self, name, seconds):
+		'Record duration of one phase'
+		with self.lock:
+			record = self.phases.setdefault(name, {'count': 0, 'total': 0.0})
+			record['count'] += 1
+			record['total'] += seconds
+
+	def phase(self, name):
+		'Context to time a phase: "with telemetry.phase(name):"'
+		return Phase(self, name)
+
+	def count(self, name, n=1):
+		'Add to counter'
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + n
+
+	def sleep(self, seconds):
+		'Sleep and count the time'
+		sleep(seconds)
+		self.count('sleep_seconds', seconds)
+
+	def summary(self):
+		'Give everything recorded as dictionary'
+		with self.lock:
+			return {
+				'seconds': perf_counter() - self.start,
+				'buckets': list(self.BUCKETS),
+				'commands': { i: dict(j, histogram=list(j['histogram'])) for i, j in self.commands.items() },
+				'phases': { i: dict(j) for i, j in self.phases.items() },
+				'counters': dict(self.counters)
+			}
+
+	def write(self, path):
+		'Write summary to JSON file'
+		with open(path, 'w', encoding='utf-8') as f:
+			jdump(self.summary(), f, indent=1)
+
+	def report(self):
+		'Log a short summary'
+		summary = self.summary()
+		self.logger.info('Telemetry: job took %.1f seconds' % summary['seconds'])
+		for i, j in sorted(summary['phases'].items(), key=lambda i: -i[1]['total'])[:self.TOP]:
+			self.logger.info('Telemetry: phase %s: %d x, %.1f seconds' % (i, j['count'], j['total']))
+		for i, j in sorted(summary['commands'].items(), key=lambda i: -i[1]['total'])[:self.TOP]:
+			self.logger.info('Telemetry: %s: %d x, %.1f seconds, max. %.3f seconds' % (i, j['count'], j['total'], j['max']))
+		if summary['counters'] != {}:
+			self.logger.info('Telemetry: %s' % ', '.join( '%s: %s' % (i, round(j, 1)) for i, j in sorted(summary['counters'].items()) ))
+
+class Phase:
+	'Context that records the time spent inside as phase'
+
+	def __init__(self, telemetry, name):
+		'Create object, time starts on entering'
+		self.telemetry = telemetry
+		self.name = name
+
+	def __enter__(self):
+		'Start timer'
+		self.start = perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		'Record time, also if an exception occured'
+		self.telemetry.phase_time(self.name, perf_counter() - self.start)
+		return False
+
+def phase(function):
+	'Decorator to time a method of a module (with self.chrome) as phase named like the method'
+	@wraps(function)
+	def timed(self, *args, **kwargs):
+		with self.chrome.telemetry.phase(function.__name__):
+			return function(self, *args, **kwargs)
+	return timed
@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 
 from time import sleep
+from datetime import datetime
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
 from base.logger import Logger, DEBUG
 from base.storage import Storage
 from base.chrometools import Chrome
+from base.telemetry import Telemetry
+from base.stitcher import Stitcher
 from modules.facebook import Facebook
 from modules.instagram import Instagram
 from modules.twitter import Twitter
@@ -28,7 +33,9 @@ class Worker:
 				'limitPhotos': {'name': 'Max. Screenhots in Photos', 'default': Facebook.DEFAULTPAGELIMIT, 'row': 2, 'column': 3},
 				'Network': {'name': 'Network of Friends', 'default': False, 'row': 3, 'column': 0},
 				'depthNetwork': {'name': 'Depth of recursion', 'default': Facebook.DEFAULTNETWORKDEPTH, 'row': 3,'column': 1},
-				'extendNetwork': {'name': 'incl. Timeline responses', 'default': False, 'row': 3, 'column': 2}
+				'extendNetwork': {'name': 'incl. Timeline responses', 'default': False, 'row': 3, 'column': 2},
+				'dataOnly': {'name': 'Lists only as PDF', 'default': False, 'row': 3, 'column': 3},
+				'keepSession': {'name': 'Reuse login session', 'default': False, 'row': 4, 'column': 0}
 			}
 		},
 		{
@@ -36,7 +43,8 @@ class Worker:
 			'login': None,
 			'options': {
 				'Media': {'name': 'Download media files', 'default': False, 'row': 0, 'column': 0},
-				'limitPages': {'name': 'Max. Screenshots', 'default': Instagram.DEFAULTPAGELIMIT, 'row': 1, 'column': 0}
+				'limitPages': {'name': 'Max. Screenshots', 'default': Instagram.DEFAULTPAGELIMIT, 'row': 1, 'column': 0},
+				'parallelTabs': {'name': 'Parallel tabs', 'default': Instagram.DEFAULTTABS, 'row': 1, 'column': 1}
 			}
 		},
 		{
@@ -50,12 +58,23 @@ class Worker:
 		}
 	)
 
+	CAPTURE = {	# screenshot and storage options every module gets in extra rows (row is counted from the first extra row)
+		'tileHeight': {'name': 'Tile height (0 = scroll)', 'default': 0, 'column': 0},
+		'imageFormat': {'name': 'Image format (png, jpeg, webp)', 'default': 'png', 'column': 1},
+		'imageQuality': {'name': 'Quality (jpeg, webp)', 'default': Chrome.DEFAULT_IMAGE_QUALITY, 'column': 2},
+		'fastCapture': {'name': 'Optimize for speed', 'default': False, 'column': 3},
+		'dedupeFrames': {'name': 'Equal frames (link, skip)', 'default': '', 'row': 1, 'column': 0},
+		'stitchFrames': {'name': 'Stitch frames (keep, replace)', 'default': '', 'row': 1, 'column': 1},
+		'blobStore': {'name': 'Store media once', 'default': False, 'row': 1, 'column': 2}
+	}
+
 	def __init__(self, loglevel):
 		'Create object that works out the jobs'
 		logger = Logger(loglevel)	# configure logging
 		self.logger = logger.get()	# get the logging function
 		self.storage = Storage(self.logger)	# object for file system accesss
 		self.chrome = Chrome(self.logger)	# object to work with chrome/chromium
+		self.concurrency = 1	# number of jobs to execute in parallel, each with its own browser
 		self.modulenames = [ i['name'] for i in self.MODULES ]
 		self.logins = dict()
 		self.options = dict()
@@ -66,8 +85,12 @@ class Worker:
 				self.logins[i['name']] = None
 			if i['options'] != None:
 				self.options[i['name']] = { j: i['options'][j] for j in i['options'] }
+				row = max( j['row'] for j in i['options'].values() ) + 1	# capture options go below
 			else:
-				self.options[i['name']] = None
+				self.options[i['name']] = dict()
+				row = 0
+			for j in self.CAPTURE:
+				self.options[i['name']][j] = dict(self.CAPTURE[j], row=row+self.CAPTURE[j].get('row', 0))
 		self.options_defaults = { i: { j: self.options[i][j]['default'] for j in self.options[i] } for i in self.options }
 
 	def new_job(self, module):
@@ -83,13 +106,39 @@ class Worker:
 			job['login'] = None
 		return job
 
-	def execute_job(self, job, stop=None):
-		'Execute jobs'
-		self.storage.mkmoddir(job['module'])
-		cmd = '%s(job, self.storage, self.chrome, stop=stop)' % job['module']
+	def execute_job(self, job, stop=None, storage=None, chrome=None, number=1):
+		'Execute job, by default with the storage and chrome object of the worker - number of the job of this module gives the module directory'
+		if storage == None:
+			storage = self.storage
+		if chrome == None:
+			chrome = self.chrome
+		chrome.prewarm()	# browser starts up while the job is set up
+		telemetry = Telemetry(self.logger)
+		chrome.telemetry = telemetry
+		storage.telemetry = telemetry
+		storage.stop = stop	# downloads abort on stop and resume in the next run
+		storage.mkmoddir(job['module'], number=number)
+		chrome.tile_height = job['options'].get('tileHeight', 0)
+		chrome.set_image_format(
+			job['options'].get('imageFormat', 'png'),
+			quality = job['options'].get('imageQuality', Chrome.DEFAULT_IMAGE_QUALITY),
+			optimize = job['options'].get('fastCapture', False)
+		)
+		chrome.writer.set_dedupe(job['options'].get('dedupeFrames', ''))
+		storage.use_blobs(job['options'].get('blobStore', False))
+		if job['options'].get('stitchFrames', '') != '':
+			chrome.stitch = Stitcher(
+				self.logger,
+				mode = job['options']['stitchFrames'],
+				image_format = chrome.shot_params['format'],
+				quality = chrome.shot_params.get('quality')
+			)
+		else:
+			chrome.stitch = None
+		cmd = '%s(job, storage, chrome, stop=stop)' % job['module']
 		self.logger.debug('Worker: job: %s' % job)
-		self.logger.debug('Worker: chrome.path: %s' % self.chrome.path)
-		self.logger.debug('Worker: output directory: %s' % self.storage.moddir)
+		self.logger.debug('Worker: chrome.path: %s' % chrome.path)
+		self.logger.debug('Worker: output directory: %s' % storage.moddir)
 		self.logger.debug('Worker: cmd: %s' % cmd)
 		self.logger.debug('Worker: loglevel: %s' % self.logger.level)
 		if self.logger.level <= DEBUG :
@@ -99,10 +148,54 @@ class Worker:
 				exec(cmd)
 			except:
 				pass
-		if self.chrome.is_running():
+		if chrome.is_running():
 			self.logger.warning('Worker: Chrome/Chromium was still running finishing jobs')
 			if self.logger.level < DEBUG:
 				self.logger.visible('Worker: finished, now sleeping for 5 seconds until closing browser')
 				sleep(5)
-			self.chrome.close()
+			chrome.close()
+		elif chrome.is_alive():	# started in advance but never used
+			chrome.close()
+		chrome.writer.join()	# all screenshots have to be on disk when job is done
+		storage.wait_downloads()	# and the media downloaded in background
+		if storage.blobs != None:
+			storage.blobs.save()	# url cache for the next jobs and runs
+		try:
+			telemetry.write(storage.modpath('telemetry_%s.json' % datetime.utcnow().strftime('%Y-%m-%d_%H%M%S_%f')))
+		except OSError as error:
+			self.logger.warning('Worker: unable to write telemetry: %s' % error)
+		telemetry.report()
 		self.logger.debug('Worker: done!')
+
+	def execute_jobs(self, jobs, stop=None, started=None):
+		'Execute list of jobs, up to self.concurrency at the same time - started(n) is called when job n begins'
+		if self.concurrency <= 1 or len(jobs) <= 1 or self.chrome.endpoint != None or self.chrome.recorder != None:	# one after the other with the main browser (also on record/replay)
+			slots = [(self.storage, self.chrome)]
+		else:	# pool of browsers, each with its own port and profile
+			slots = [(self.storage, self.chrome)] + [
+				(self.storage.clone(), Chrome(self.logger, path=self.chrome.path))
+				for i in range(min(self.concurrency, len(jobs)) - 1)
+			]
+		numbers = []	# n-th job of its module in the list, so its directory does not depend on the browser that runs it
+		for i, job in enumerate(jobs):
+			numbers.append([ j['module'] for j in jobs[:i+1] ].count(job['module']))
+		free = Queue()
+		for i in slots:
+			free.put(i)
+		def run(n):
+			if stop != None and stop.is_set():
+				return None
+			storage, chrome = free.get()
+			try:
+				if started != None:
+					started(n)
+				self.execute_job(jobs[n], stop=stop, storage=storage, chrome=chrome, number=numbers[n])
+			except Exception as error:
+				if self.logger.level <= DEBUG:
+					raise
+				return str(error)
+			finally:
+				free.put((storage, chrome))
+			return None
+		with ThreadPoolExecutor(max_workers=len(slots), thread_name_prefix='job') as pool:
+			return [ i for i in pool.map(run, range(len(jobs))) if i != None ]	# errors
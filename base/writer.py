@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+from os import link as os_link
+from io import BytesIO
+from base64 import b64decode
+from threading import BoundedSemaphore, Lock
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures import wait as futures_wait
+try:	# only needed to dedupe frames
+	from PIL import Image
+except ImportError:
+	Image = None
+
+def dhash(data):
+	'Give 64 bit difference hash of an image given as base64 (runs in worker process)'
+	image = Image.open(BytesIO(b64decode(data))).convert('L').resize((9, 8))
+	pixels = list(image.getdata())
+	bits = 0
+	for row in range(8):
+		for col in range(8):
+			bits = bits << 1 | (pixels[row*9+col] > pixels[row*9+col+1])
+	return bits
+
+class Writer:
+	'Decode and write files given as base64 by Chrome/Chromium in background threads'
+
+	WORKERS = 2	# number of threads decoding and writing
+	QUEUE = 16	# max. number of files waiting to be written before put blocks
+	DEDUPE_MODES = ('link', 'skip')	# hard link or do not write frames that look like the previous one
+	DEDUPE_THRESHOLD = 2	# max. number of different bits of the hashes to regard frames as equal
+
+	def __init__(self, logger, workers=WORKERS, queue=QUEUE):
+		'Create thread pool'
+		self.logger = logger
+		self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='writer')
+		self.slots = BoundedSemaphore(queue)	# backpressure on the thread driving the browser
+		self.lock = Lock()
+		self.futures = set()
+		self.errors = 0
+		self.dedupe = None	# None = write every frame
+		self.threshold = self.DEDUPE_THRESHOLD
+		self.hasher = None	# process to compute the hashes, started on demand
+		self.frames = dict()	# hash and write futures of the last frame by group
+
+	def set_dedupe(self, mode=None, threshold=DEDUPE_THRESHOLD):
+		'Set handling of frames that look like the previous frame of their group: None/"", "link" or "skip"'
+		if mode == None or mode == '':
+			self.dedupe = None
+			return
+		if not mode in self.DEDUPE_MODES:
+			raise Exception('Unknown dedupe mode %s' % mode)
+		if Image == None:
+			self.logger.warning('Writer: Pillow (PIL) is not installed, all frames will be written')
+			self.dedupe = None
+			return
+		self.dedupe = mode
+		self.threshold = threshold
+		if self.hasher == None:
+			self.hasher = ProcessPoolExecutor(max_workers=1)
+
+	def put(self, data, path, group=None):
+		'Queue base64 encoded data to be written to path, block while the queue is full - frames of a group are deduped'
+		self.slots.acquire()
+		with self.lock:
+			if group != None and self.dedupe != None:
+				hash_future = self.hasher.submit(dhash, data)
+				future = self.pool.submit(self.__frame__, data, path, group, hash_future, self.frames.get(group))
+				self.frames[group] = (hash_future, future)
+			else:
+				future = self.pool.submit(self.__write__, data, path)
+			self.futures.add(future)
+		future.add_done_callback(self.__done__)
+		return future
+
+	def then(self, futures, function, *args):
+		'Call function(*args) in the pool when the given futures are done, e.g. to process written frames'
+		self.slots.acquire()
+		with self.lock:
+			future = self.pool.submit(self.__then__, futures, function, args)	# futures were submitted earlier, so this can not block the pool
+			self.futures.add(future)
+		future.add_done_callback(self.__done__)
+		return future
+
+	def __then__(self, futures, function, args):
+		'Wait for futures, then call function (runs in pool)'
+		futures_wait(futures)
+		return function(*args)
+
+	def end_group(self, group):
+		'Forget last frame of group, the next frame is not compared'
+		with self.lock:
+			self.frames.pop(group, None)
+
+	def __write__(self, data, path):
+		'Decode and write (runs in pool)'
+		with open(path, 'wb') as f:
+			f.write(b64decode(data))
+		return path
+
+	def __frame__(self, data, path, group, hash_future, previous):
+		'Compare frame to the previous one of the group, then write, link or skip, give path of the file with the content'
+		try:
+			bits = hash_future.result()
+		except Exception as error:
+			self.logger.debug('Writer: no hash for %s: %s' % (path, error))
+			return self.__decision__(group, path, None, None, 'kept', self.__write__(data, path))
+		if previous == None:
+			return self.__decision__(group, path, bits, None, 'kept', self.__write__(data, path))
+		futures_wait([previous[1]])	# previous frame was submitted earlier, so it is running or done
+		try:
+			source = previous[1].result()
+			distance = bin(bits ^ previous[0].result()).count('1')
+		except Exception:
+			return self.__decision__(group, path, bits, None, 'kept', self.__write__(data, path))
+		if distance > self.threshold:
+			return self.__decision__(group, path, bits, distance, 'kept', self.__write__(data, path))
+		if self.dedupe == 'skip':
+			return self.__decision__(group, path, bits, distance, 'skipped', source)
+		try:
+			os_link(source, path)
+		except OSError:	# e.g. file system without hard links
+			return self.__decision__(group, path, bits, distance, 'kept', self.__write__(data, path))
+		return self.__decision__(group, path, bits, distance, 'linked', source)
+
+	def __decision__(self, group, path, bits, distance, decision, source):
+		'Log decision on a frame to <group>_frames.csv, give back path of the file with the content'
+		line = '"%s";"%s";"%s";"%s";"%s"\n' % (
+			path,
+			'' if bits == None else '%016x' % bits,
+			'' if distance == None else distance,
+			decision,
+			source
+		)
+		with self.lock:
+			with open('%s_frames.csv' % group, 'a', encoding='utf-8') as f:
+				f.write(line)
+		self.logger.debug('Writer: %s %s (%s)' % (decision, path, source))
+		return source
+
+	def __done__(self, future):
+		'Free slot and log errors'
+		with self.lock:
+			self.futures.discard(future)
+		self.slots.release()
+		if future.exception() != None:
+			self.errors += 1
+			self.logger.warning('Writer: unable to write file: %s' % future.exception())
+
+	def join(self):
+		'Wait until all queued files are written'
+		with self.lock:
+			futures = list(self.futures)
+		futures_wait(futures)
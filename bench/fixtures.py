@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from threading import Thread
+from zlib import compress, crc32
+from struct import pack
+
+class FixtureHandler(BaseHTTPRequestHandler):
+	'Generate the synthetic pages: /feed, /grid, /friends and /img/<n>.png'
+
+	ITEMS = 200	# default number of posts/photos/friends
+	BATCH = 10	# default number of items appended when the page is scrolled to the bottom
+	DELAY = 100	# default milliseconds to "load" a batch
+	START = 1500000000	# data-utime of the newest post
+	STEP = 86400	# seconds between posts
+
+	def log_message(self, *args):
+		'Be quiet'
+		pass
+
+	def do_GET(self):
+		'Route request'
+		url = urlparse(self.path)
+		query = { i: int(j[0]) for i, j in parse_qs(url.query).items() if j[0].isdigit() }
+		items = query.get('items', self.ITEMS)
+		batch = query.get('batch', self.BATCH)
+		delay = query.get('delay', self.DELAY)
+		if url.path == '/feed':
+			self.__send__(self.__page__('Feed', self.__feed_item__(), items, batch, delay), 'text/html')
+		elif url.path == '/grid':
+			self.__send__(self.__page__('Grid', self.__grid_item__(), items, batch, delay), 'text/html')
+		elif url.path == '/friends':
+			self.__send__(self.__page__('Friends', self.__friend_item__(), items, batch, delay), 'text/html')
+		elif url.path.startswith('/img/'):
+			try:
+				n = int(url.path[5:].split('.', 1)[0])
+			except ValueError:
+				n = 0
+			self.__send__(png(64, 64, (n * 37 % 256, n * 91 % 256, n * 53 % 256)), 'image/png')
+		else:
+			self.send_error(404)
+
+	def __send__(self, body, content_type):
+		'Send response'
+		if isinstance(body, str):
+			body = body.encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(body)))
+		self.send_header('Cache-Control', 'no-store')
+		self.end_headers()
+		self.wfile.write(body)
+
+	def __feed_item__(self):
+		'JavaScript function giving the html of post n: text with see more link, date and photo'
+		return '''
+			function(n) {
+				return '<div class="post"><abbr data-utime="' + (%d - n * %d) + '">post ' + n + '</abbr>'
+					+ '<p>Lorem ipsum dolor sit amet ' + n + ' <a class="see_more_link" onclick="'
+					+ 'this.outerHTML = \\'<span class=more>consectetur adipiscing elit, sed do eiusmod tempor.</span>\\'">See more</a></p>'
+					+ '<img src="/img/' + n + '.png" width="320" height="160"></div>';
+			}
+		''' % (self.START, self.STEP)
+
+	def __grid_item__(self):
+		'JavaScript function giving the html of photo n of a grid with post links'
+		return '''
+			function(n) {
+				return '<a href="/p/' + n + '/"><img src="/img/' + n + '.png" width="300" height="300"></a>';
+			}
+		'''
+
+	def __friend_item__(self):
+		'JavaScript function giving the html of friend n'
+		return '''
+			function(n) {
+				return '<li class="friend"><a href="/profile.php?id=' + (100000 + n) + '">Friend ' + n + '</a>'
+					+ '<img src="/img/' + n + '.png" width="60" height="60"></li>';
+			}
+		'''
+
+	def __page__(self, title, item, items, batch, delay):
+		'Infinite scroll page: the first batch is there, more are appended when the bottom is visible'
+		return '''<!doctype html>
+<html>
+<head>
+	<title>%s</title>
+	<style type="text/css">
+		body {font-family: Sans-Serif; margin: 0 auto; width: 800px;}
+		.post, .friend {min-height: 240px; border-bottom: 1px solid #ccc;}
+		article a {display: inline-block; width: 260px;}
+	</style>
+</head>
+<body>
+	<h1>%s</h1>
+	<article id="content"></article>
+	<div id="loader" style="height: 10px;"></div>
+	<script>
+		var item = %s;
+		var items = %d;
+		var batch = %d;
+		var delay = %d;
+		var shown = 0;
+		var loading = false;
+		window.somedoBenchLastAppend = Date.now();
+		function append() {
+			var html = '';
+			for (var i=0; i<batch && shown<items; i++) { html += item(++shown) }
+			document.getElementById('content').insertAdjacentHTML('beforeend', html);
+			window.somedoBenchLastAppend = Date.now();
+			loading = false;
+		}
+		append();
+		new IntersectionObserver(function(entries) {
+			if (entries[0].isIntersecting && !loading && shown < items) {
+				loading = true;
+				setTimeout(append, delay);
+			}
+		}).observe(document.getElementById('loader'));
+	</script>
+</body>
+</html>
+''' % (title, title, item, items, batch, delay)
+
+def png(width, height, rgb):
+	'Give a PNG image of one color as bytes'
+	def chunk(kind, data):
+		return pack('>I', len(data)) + kind + data + pack('>I', crc32(kind + data) & 0xffffffff)
+	row = b'\x00' + bytes(rgb) * width
+	return (
+		b'\x89PNG\r\n\x1a\n'
+		+ chunk(b'IHDR', pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+		+ chunk(b'IDAT', compress(row * height))
+		+ chunk(b'IEND', b'')
+	)
+
+class FixtureServer:
+	'Local HTTP server with the fixture pages'
+
+	def __init__(self, port=0):
+		'Start server in background thread'
+		self.httpd = ThreadingHTTPServer(('127.0.0.1', port), FixtureHandler)
+		self.port = self.httpd.server_address[1]
+		self.thread = Thread(target=self.httpd.serve_forever, daemon=True)
+		self.thread.start()
+
+	def url(self, path, **query):
+		'Build URL of a fixture page'
+		return 'http://127.0.0.1:%d%s?%s' % (self.port, path, '&'.join( '%s=%d' % i for i in query.items() ))
+
+	def close(self):
+		'Stop server'
+		self.httpd.shutdown()
+		self.httpd.server_close()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+from sys import argv, exit as sys_exit
+from os import path as os_path
+from os import listdir, mkdir
+from time import perf_counter
+from datetime import datetime
+from statistics import median
+from tempfile import mkdtemp
+from shutil import rmtree
+from json import dump as jdump
+from base.logger import Logger
+from base.chrometools import Chrome
+from base.telemetry import Telemetry
+from modules.facebook import Facebook
+from modules.instagram import Instagram
+from bench.fixtures import FixtureServer, FixtureHandler
+
+class Bench:
+	'Drive the Chrome helpers and module extractors against the fixture pages and measure'
+
+	REPEAT = 3	# runs per scenario, the median is reported
+	LIMIT = 1000	# page limit for expand_page (fixtures end before)
+	SCENARIOS = ('expand_feed', 'click_feed', 'terminator_feed', 'grid_links', 'friends_list', 'entire_page_png')
+
+	def __init__(self, logger, chrome_path=None, repeat=REPEAT):
+		'Start fixture server and browser'
+		self.logger = logger
+		self.repeat = max(repeat, 1)
+		self.server = FixtureServer()
+		self.chrome = Chrome(logger, path=chrome_path)
+		if self.chrome.path == None:
+			raise RuntimeError('Chrome/Chromium not found')
+		self.chrome.open()
+		self.tmpdir = mkdtemp(prefix='somedo_bench_')
+
+	def run(self, names=None):
+		'Run scenarios (all by default), give results as dictionary'
+		results = dict()
+		for name in self.SCENARIOS:
+			if names != None and not name in names:
+				continue
+			runs = [ self.__measure__(getattr(self, name)) for i in range(self.repeat) ]
+			results[name] = { i: median( j[i] for j in runs ) for i in runs[0] }
+			self.logger.info('Bench: %s: %s' % (name, ', '.join( '%s=%s' % (i, round(j, 3)) for i, j in results[name].items() )))
+		return results
+
+	def __measure__(self, scenario):
+		'Run one scenario with fresh telemetry and add timings and CDP calls to its metrics'
+		self.chrome.telemetry = Telemetry(self.logger)
+		self.steps = 0
+		start = perf_counter()
+		metrics = scenario()
+		metrics['seconds'] = perf_counter() - start
+		summary = self.chrome.telemetry.summary()
+		metrics['cdp_calls'] = sum( i['count'] for i in summary['commands'].values() )
+		if self.steps > 0:
+			metrics['steps'] = self.steps
+			metrics['pages_per_minute'] = self.steps * 60 / metrics['seconds']
+			metrics['cdp_calls_per_page'] = metrics['cdp_calls'] / self.steps
+		return metrics
+
+	def __step__(self):
+		'Per page action counting the scroll steps'
+		self.steps += 1
+
+	def __latency__(self):
+		'Milliseconds from the last content appended by the page until now (end detection)'
+		return self.chrome.runtime_eval('JSON.stringify(Date.now() - window.somedoBenchLastAppend)')
+
+	def __count__(self, class_name):
+		'Number of elements of a class in the page'
+		return self.chrome.runtime_eval('JSON.stringify(document.getElementsByClassName("%s").length)' % class_name)
+
+	def expand_feed(self):
+		'Scroll through an infinite feed'
+		self.chrome.navigate(self.server.url('/feed', items=200, batch=10, delay=100))
+		self.chrome.expand_page(per_page_action=self.__step__, limit=self.LIMIT)
+		return {'end_latency_ms': self.__latency__(), 'posts': self.__count__('post')}
+
+	def click_feed(self):
+		'Scroll through a feed and click all see more links'
+		self.chrome.navigate(self.server.url('/feed', items=100, batch=10, delay=100))
+		self.chrome.expand_page(
+			click_elements_by = [['ClassName', 'see_more_link']],
+			per_page_action = self.__step__,
+			limit = self.LIMIT
+		)
+		return {'end_latency_ms': self.__latency__(), 'expanded': self.__count__('more')}
+
+	def terminator_feed(self):
+		'Scroll through a feed with expand_page of the Facebook module until its date terminator stops'
+		facebook = Facebook.__new__(Facebook)	# only the extractor, no login
+		facebook.chrome = self.chrome
+		until = datetime.fromtimestamp(FixtureHandler.START - 100 * FixtureHandler.STEP).strftime('%Y-%m-%d')	# stop at post 100
+		self.chrome.navigate(self.server.url('/feed', items=400, batch=10, delay=50))
+		facebook.expand_page(expand=False, until=until, limit=self.LIMIT)	# same path as get_timeline
+		posts = self.__count__('post')
+		if posts >= 400:
+			raise RuntimeError('Bench: terminator did not stop the feed at %s' % until)
+		return {'posts': posts}
+
+	def grid_links(self):
+		'Harvest post links of a photo grid with the extractor of the Instagram module'
+		instagram = Instagram.__new__(Instagram)	# only the extractor
+		instagram.chrome = self.chrome
+		instagram.links = dict()
+		def action():
+			self.__step__()
+			instagram.get_links()
+		self.chrome.navigate(self.server.url('/grid', items=300, batch=30, delay=100))
+		self.chrome.expand_page(per_page_action=action, limit=self.LIMIT)
+		return {'end_latency_ms': self.__latency__(), 'links': len(instagram.links)}
+
+	def friends_list(self):
+		'Scroll through a friend list and extract the entries'
+		self.chrome.navigate(self.server.url('/friends', items=300, batch=20, delay=100))
+		self.chrome.expand_page(per_page_action=self.__step__, limit=self.LIMIT)
+		friends = self.chrome.get_outer_html('ClassName', 'friend')
+		return {'end_latency_ms': self.__latency__(), 'friends': len(friends)}
+
+	def entire_page_png(self):
+		'Capture a long page in tiles'
+		self.chrome.navigate(self.server.url('/feed', items=100, batch=100, delay=0))
+		path = os_path.join(self.tmpdir, 'entire')
+		rmtree(path, ignore_errors=True)	# fresh directory to count the tiles
+		mkdir(path)
+		self.chrome.entire_page_png(os_path.join(path, 'page'), tile_height=Chrome.TILE_HEIGHT)
+		self.chrome.writer.join()
+		files = [ os_path.join(path, i) for i in listdir(path) ]
+		return {'tiles': len(files), 'bytes': sum( os_path.getsize(i) for i in files )}
+
+	def close(self):
+		'Stop browser and server, remove temporary files'
+		self.chrome.close()
+		self.server.close()
+		rmtree(self.tmpdir, ignore_errors=True)
+
+if __name__ == '__main__':	# python -m bench.run [-c CHROME] [-n REPEAT] [-o RESULTS.json] [SCENARIO ...]
+	params = argv[1:]
+	chrome_path = None
+	repeat = Bench.REPEAT
+	outfile = None
+	names = []
+	while len(params) > 0:
+		opt = params.pop(0)
+		try:
+			if opt in ('-c', '--chrome'):
+				chrome_path = params.pop(0)
+			elif opt in ('-n', '--repeat'):
+				repeat = int(params.pop(0))
+			elif opt in ('-o', '--out'):
+				outfile = params.pop(0)
+			elif opt in Bench.SCENARIOS:
+				names.append(opt)
+			else:
+				raise ValueError(opt)
+		except (IndexError, ValueError):
+			print('Usage: python -m bench.run [-c CHROME] [-n REPEAT] [-o RESULTS.json] [%s ...]' % ' | '.join(Bench.SCENARIOS))
+			sys_exit(1)
+	logger = Logger('info').get()
+	bench = Bench(logger, chrome_path=chrome_path, repeat=repeat)
+	try:
+		results = bench.run(names if names != [] else None)
+	finally:
+		bench.close()
+	if outfile != None:
+		with open(outfile, 'w', encoding='utf-8') as f:
+			jdump(results, f, indent=1)
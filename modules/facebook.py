@@ -9,6 +9,7 @@ from re import findall as rfindall
 from base.chrometools import Chrome
 from base.cutter import Cutter
 from base.logger import DEBUG
+from base.telemetry import phase
 from vis.netvis import NetVis
 
 class Facebook:
@@ -19,6 +20,7 @@ class Facebook:
 	DEFAULTPAGELIMIT = 50
 	DEFAULTNETWORKDEPTH = 1	# network: 1 = get the friends of the target accounts
 	NEWLOGINAFTER = 100	# network: close browser and login again after a limited number of profile / landing visits
+	FIRSTPARTY = ('facebook.com', 'fbcdn.net', 'facebook.net')	# scripts from other hosts are blocked in data only mode
 
 	def __init__(self, job, storage, chrome, stop=None):
 		'Generate object for Facebook by giving the needed parameters'
@@ -87,7 +89,7 @@ class Facebook:
 
 	def sleep(self, t):
 		'Sleep a slightly ranomized time'
-		tsleep(t + runiform(0, 0.1))
+		self.chrome.telemetry.sleep(t + runiform(0, 0.1))
 
 	def extract_paths(self, target):
 		'Extract facebook paths from target that might be urls'
@@ -252,17 +254,18 @@ class Facebook:
 
 	def rm_pagelets(self):
 		'Remove bluebar and other unwanted pagelets'
-		self.chrome.rm_outer_html_by_id('pagelet_bluebar')
-		self.chrome.rm_outer_html_by_id('pagelet_sidebar')
-		self.chrome.rm_outer_html_by_id('pagelet_dock')
-		self.chrome.rm_outer_html_by_id('pagelet_escape_hatch')	# remove "Do you know ...?"
-		self.chrome.rm_outer_html_by_id('pagelet_ego_pane')	# remove "Suggested Groups"
-		self.chrome.rm_outer_html_by_id('pagelet_rhc_footer')
-		self.chrome.rm_outer_html_by_id('pagelet_page_cover')
-		self.chrome.rm_outer_html_by_id('pagelet_timeline_composer')
-		self.chrome.rm_outer_html_by_id('ChatTabsPagelet')
-		self.chrome.rm_outer_html_by_id('BuddylistPagelet')
-		self.chrome.rm_outer_html_by_id('PageComposerPagelet_')
+		with self.chrome.batch():	# one round trip for all
+			self.chrome.rm_outer_html_by_id('pagelet_bluebar')
+			self.chrome.rm_outer_html_by_id('pagelet_sidebar')
+			self.chrome.rm_outer_html_by_id('pagelet_dock')
+			self.chrome.rm_outer_html_by_id('pagelet_escape_hatch')	# remove "Do you know ...?"
+			self.chrome.rm_outer_html_by_id('pagelet_ego_pane')	# remove "Suggested Groups"
+			self.chrome.rm_outer_html_by_id('pagelet_rhc_footer')
+			self.chrome.rm_outer_html_by_id('pagelet_page_cover')
+			self.chrome.rm_outer_html_by_id('pagelet_timeline_composer')
+			self.chrome.rm_outer_html_by_id('ChatTabsPagelet')
+			self.chrome.rm_outer_html_by_id('BuddylistPagelet')
+			self.chrome.rm_outer_html_by_id('PageComposerPagelet_')
 
 	def rm_profile_cover(self):
 		'Remove fbProfileCover'
@@ -270,43 +273,27 @@ class Facebook:
 
 	def rm_left(self):
 		'Remove Intro, Photos, Friends etc. on the left'
-		self.chrome.rm_outer_html('ClassName', '_1vc-')
-		self.chrome.rm_outer_html_by_id('timeline_small_column')
+		with self.chrome.batch():
+			self.chrome.rm_outer_html('ClassName', '_1vc-')
+			self.chrome.rm_outer_html_by_id('timeline_small_column')
 
 	def rm_right(self):
 		'Remove stuff right of timeline/posts'
-		self.chrome.rm_outer_html_by_id('entity_sidebar')
-		self.chrome.rm_outer_html_by_id('pages_side_column')
-		self.chrome.rm_outer_html_by_id('rightCol')
+		with self.chrome.batch():
+			self.chrome.rm_outer_html_by_id('entity_sidebar')
+			self.chrome.rm_outer_html_by_id('pages_side_column')
+			self.chrome.rm_outer_html_by_id('rightCol')
 
 	def rm_write_comment(self):
 		'Remove Write a comment...'
 		self.chrome.rm_outer_html('ClassName', 'UFIList')
 
-	def click_translations(self):
-		'Find the See Translation buttons and click'
-		html = self.chrome.get_inner_html_by_id('recent_capsule_container')
-		if html == None:
-			html = self.chrome.get_inner_html_by_id('pagelet_timeline_main_column')
-		if html == None:
-			html = self.chrome.get_inner_html_by_id('pagelett_group_mall')
-		if html == None:
-			return
-		for i in rfindall('<span id="translationSpinnerPlaceholder_[^"]+"', html):
-			self.chrome.click_element_by_id(i[10:-1])
-
 	def terminator(self):
 		'Check date of posts to abort'
 		if self.stop_utc <= 0:
 			return False
-		for i in self.chrome.get_outer_html('TagName', 'abbr'):
-			m = rsearch(' data-utime="[0-9]+" ', i)
-			try:
-				if int(m.group()[13:-2]) <= self.stop_utc:
-					return True
-			except:
-				pass
-		return False
+		oldest = self.chrome.get_min_int('abbr[data-utime]', 'data-utime')	# tracked in the page, so one number per step
+		return oldest != None and oldest <= self.stop_utc
 
 	def expand_page(self, path_no_ext='', expand=True, translate=False, until=ONEYEARAGO, limit=0):
 		'Go through page, expand, translate, take screenshots and generate pdf'
@@ -320,16 +307,13 @@ class Facebook:
 			])
 		if translate:	# show translations if in options
 			clicks.extend([
-				['ClassName', 'UFITranslateLink']
+				['ClassName', 'UFITranslateLink'],
+				['Query', 'span[id^="translationSpinnerPlaceholder_"]']
 			])
-			action = self.click_translations()
-		else:
-			action = None
-		self.stop_utc = until
+		self.stop_utc = self.get_utc(until)	# date as YYYY-MM-DD, 0 = no limit
 		self.chrome.expand_page(
 			path_no_ext = path_no_ext,
 			click_elements_by = clicks,
-			per_page_action = action,
 			terminator=self.terminator,
 			limit=limit
 		)
@@ -349,12 +333,43 @@ class Facebook:
 		html += '</h2>\n\t<h2><a href="'
 		html += account['link']
 		html += '" style="color: red; border-style: solid; padding: 0.2em;">Warning: Link to online Facebook account!!!</a>'
-		html += '</h2></br>\n\t<img src="./account.png" alt="" style="border: solid;"\>\n</body>\n</html>'
+		html += '</h2></br>\n\t<img src="./account.%s" alt="" style="border: solid;"\>\n</body>\n</html>' % self.chrome.image_ext
 		self.storage.write_xml(html, account['path'], 'account.html')
 
+	def is_logged_in(self):
+		'Check if the page shows a logged in account'
+		return self.chrome.get_inner_html_by_id('findFriendsNav') != None
+
+	def restore_session(self):
+		'Try to reuse the stored session of the next investigator account'
+		revolver = self.loginrevolver + 1
+		if revolver == len(self.emails):
+			revolver = 0
+		cookies = self.storage.load_session(self.emails[revolver])
+		if cookies == None or not self.chrome.set_cookies(cookies):
+			return False
+		self.chrome.navigate('https://www.facebook.com/')
+		if not self.is_logged_in():	# cheap probe failed, session is not valid anymore
+			self.logger.debug('Facebook: stored session of %s is not valid' % self.emails[revolver])
+			self.storage.drop_session(self.emails[revolver])
+			return False
+		self.loginrevolver = revolver
+		self.logger.info('Facebook: Reusing session of %s' % self.emails[revolver])
+		return True
+
+	def save_session(self):
+		'Store cookies of the logged in investigator account'
+		try:
+			self.storage.save_session(self.emails[self.loginrevolver], self.chrome.get_cookies())
+		except Exception as error:
+			self.logger.warning('Facebook: could not store session: %s' % error)
+
+	@phase
 	def login(self):
 		'Login to Facebook'
 		self.chrome.open(stop=self.stop)
+		if self.options['keepSession'] and self.restore_session():
+			return
 		self.chrome.navigate('https://www.facebook.com/login')	# go to facebook login
 		for i in range(len(self.emails) * 10):	# try 10x all accounts
 			if self.chrome.stop_check():
@@ -372,8 +387,10 @@ class Facebook:
 				pass
 			for j in range(10):	# try for 10 seconds ig login was succesful
 				self.sleep(1)
-				if self.chrome.get_inner_html_by_id('findFriendsNav') != None:
-						return
+				if self.is_logged_in():
+					if self.options['keepSession']:
+						self.save_session()
+					return
 		self.chrome.visible_page_png(self.storage.modpath('login'))
 		raise Exception('Could not login to Facebook.')
 
@@ -384,18 +401,19 @@ class Facebook:
 			self.login()
 		self.logger.debug('Facebook: navigate to: %s' % url)
 		for i in range(10):
-			self.chrome.navigate(url)	# go to page
+			self.chrome.navigate(url)	# go to page and wait until it is loaded
 			for j in range(10):
-				self.sleep(1)
 				try:
 					m = rsearch('<img', self.chrome.get_inner_html_by_id('content'))
 					if m != None:
 						return
 				except:
 					pass
+				self.sleep(1)
 			self.login()
 		raise Exception('Facebook might have blocked all given accounts.')
 
+	@phase
 	def get_landing(self, path):
 		'Get screenshot from start page about given user (id or path)'
 		self.logger.info('Facebook: Visiting %s', path)
@@ -405,18 +423,20 @@ class Facebook:
 		self.storage.write_dicts(account, self.ACCOUNT, account['path'], 'account.csv')	# write account infos
 		self.storage.write_json(account, account['path'], 'account.json')
 		try:	# try to download profile photo
-			self.storage.download(self.ct.src(self.chrome.get_inner_html_by_id('fbTimelineHeadline')), account['path'], 'profile.jpg')
+			self.storage.download_later(self.ct.src(self.chrome.get_inner_html_by_id('fbTimelineHeadline')), account['path'], 'profile.jpg', browser=self.chrome)
 		except:
 			pass
-		self.rm_pagelets()	# remove bluebar etc.
-		if account['type'] == 'pg':
-			self.rm_write_comment()
+		with self.chrome.batch():
+			self.rm_pagelets()	# remove bluebar etc.
+			if account['type'] == 'pg':
+				self.rm_write_comment()
 		path_no_ext = self.storage.modpath(account['path'], 'account')	# generate a file path for screenshot and pdf
 		self.chrome.visible_page_png(path_no_ext)	# save the visible part of the page as png
 		self.chrome.page_pdf(path_no_ext)	# and as pdf (when headless)
 		self.account2html(account)
 		return account	# give back the targeted account
 
+	@phase
 	def get_timeline(self, account):
 		'Get timeline'
 		self.logger.debug('Facebook: getting timeline: %s' % account['path'])
@@ -426,10 +446,11 @@ class Facebook:
 		else:
 			self.navigate(account['link'])
 			path_no_ext = self.storage.modpath(account['path'], 'timeline')
-		self.rm_profile_cover()
-		self.rm_pagelets()
-		self.rm_left()
-		self.rm_right()
+		with self.chrome.batch():	# remove all in one round trip
+			self.rm_profile_cover()
+			self.rm_pagelets()
+			self.rm_left()
+			self.rm_right()
 		self.expand_page(	# go through timeline
 			path_no_ext=path_no_ext,
 			limit=self.options['limitTimeline'],
@@ -439,6 +460,7 @@ class Facebook:
 		)
 		self.chrome.page_pdf(path_no_ext)
 
+	@phase
 	def get_about(self, account):
 		'Get About'
 		self.navigate('%s/about' % account['link'])	# go to about
@@ -447,8 +469,63 @@ class Facebook:
 		self.expand_page(path_no_ext=path_no_ext)
 		self.chrome.page_pdf(path_no_ext)
 
+	@phase
 	def get_photos(self, account):
-		'Get Photos'
+		'Get Photos, progress is kept in photos_checkpoint.json to go on after an abort'
+		checkpoint = self.storage.checkpoint(
+			{ i: self.options[i] for i in ('limitPhotos', 'expandPhotos', 'translatePhotos') },
+			account['path'],
+			'photos_checkpoint.json'
+		)
+		links = checkpoint.get('links')
+		if links == None:	# overview has not been captured yet
+			links = self.get_photo_links(account)
+			if self.chrome.stop_check():	# list might be truncated
+				return
+			checkpoint.set('links', links)
+		for cnt, url in checkpoint.get('images', dict()).items():	# downloads that did not finish before the abort
+			if not self.storage.file_exists(self.storage.modpath(account['path'], '%05d_image.jpg' % int(cnt))):
+				self.storage.download_later(url, account['path'], '%05d_image.jpg' % int(cnt))
+		for cnt, link in enumerate(links[:99999], start=1):	# to number screenshots
+			if cnt <= checkpoint.get('done', 0):	# visited in earlier run
+				continue
+			if self.chrome.stop_check():
+				return
+			self.navigate(link)
+			with self.chrome.batch():
+				self.chrome.rm_outer_html_by_id('photos_snowlift')	# show page with comments
+				self.rm_pagelets()	# remove bluebar etc.
+			path_no_ext = self.storage.modpath(account['path'], '%05d_photo' % cnt)
+			self.expand_page(
+				path_no_ext=path_no_ext,
+				limit=self.options['limitPhotos'],
+				expand=self.options['expandPhotos'],
+				translate=self.options['translatePhotos']
+			)
+			if self.chrome.stop_check():	# photo is redone in the next run
+				return
+			self.chrome.page_pdf(path_no_ext)
+			images = dict()	# counter: url of downloaded image
+			try:
+				url = self.ct.src(self.chrome.get_outer_html('ClassName', 'scaledImageFitWidth img')[0])
+				self.storage.download_later(	# photo page has been saved, image can come later
+					url,
+					account['path'],
+					'%05d_image.jpg' % cnt,
+					browser=self.chrome
+				)
+				images[str(cnt)] = url
+			except:
+				pass
+			if self.chrome.stop_check():
+				return
+			checkpoint.record(set={'done': cnt}, put={'images': images})	# only what this photo adds
+			self.chrome.go_back()
+		if not self.chrome.stop_check():
+			checkpoint.remove()
+
+	def get_photo_links(self, account):
+		'Capture overview of the photos and give links to the single photos'
 		if account['type'] == 'pg':
 			self.navigate('https://www.facebook.com/pg/%s/photos' % account['path'])
 		elif account['type'] == 'groups':
@@ -456,108 +533,60 @@ class Facebook:
 		else:
 			self.navigate(account['link'] + '/photos_all')
 		path_no_ext = self.storage.modpath(account['path'], 'photos')
-		self.rm_pagelets()	# remove bluebar etc.
-		self.rm_right()
+		with self.chrome.batch():
+			self.rm_pagelets()	# remove bluebar etc.
+			self.rm_right()
 		self.expand_page(path_no_ext=path_no_ext, limit=self.options['limitPhotos'])
 		self.rm_left()
 		self.chrome.page_pdf(path_no_ext)
-		cnt = 1	# to number screenshots
 		if account['type'] == 'pg':
 			html = self.chrome.get_inner_html_by_id('content_container')
-			if html != None:
-				for i in rfindall('<a href="https://www\.facebook\.com/[^"]+/photos/[^"]+" rel="theater">', html):
-					if self.chrome.stop_check():
-						return
-					self.navigate(i[9:-16])
-					self.chrome.rm_outer_html_by_id('photos_snowlift')	# show page with comments
-					path_no_ext = self.storage.modpath(account['path'], '%05d_photo' % cnt)
-					self.rm_pagelets()	# remove bluebar etc.
-					self.expand_page(
-						path_no_ext=path_no_ext,
-						limit=self.options['limitPhotos'],
-						expand=self.options['expandPhotos'],
-						translate=self.options['translatePhotos']
-					)
-					self.chrome.page_pdf(path_no_ext)
-					try:
-						self.storage.download(
-							self.ct.src(self.chrome.get_outer_html('ClassName', 'scaledImageFitWidth img')[0]),
-							account['path'],
-							'%05d_image.jpg' % cnt
-						)
-					except:
-						pass
-					cnt += 1
-					if cnt == 100000:
-						break
-					self.chrome.go_back()
-		elif account['type'] == 'groups':
+			if html == None:
+				return []
+			return [ i[9:-16] for i in rfindall('<a href="https://www\.facebook\.com/[^"]+/photos/[^"]+" rel="theater">', html) ]
+		if account['type'] == 'groups':
 			html = self.chrome.get_inner_html_by_id('pagelet_group_photos')
-			if html != None:
-				for i in rfindall(' href="https://www.facebook.com/photo\.php\?[^"]+', html):
-					if self.chrome.stop_check():
-						return
-					self.navigate(i[7:])
-					self.chrome.rm_outer_html_by_id('photos_snowlift')	# show page with comments
-					path_no_ext = self.storage.modpath(account['path'], '%05d_photo' % cnt)
-					self.rm_pagelets()	# remove bluebar etc.
-					self.expand_page(
-						path_no_ext=path_no_ext,
-						limit=self.options['limitPhotos'],
-						expand=self.options['expandPhotos'],
-						translate=self.options['translatePhotos']
-					)
-					self.chrome.page_pdf(path_no_ext)
-					try:
-						self.storage.download(
-							self.ct.src(self.chrome.get_outer_html('ClassName', 'scaledImageFitWidth img')[0]),
-							account['path'],
-							'%05d_image.jpg' % cnt
-						)
-					except:
-						pass
-					cnt += 1
-					if cnt == 100000:
-						break
-					self.chrome.go_back()
+			if html == None:
+				return []
+			return [ i[7:] for i in rfindall(' href="https://www.facebook.com/photo\.php\?[^"]+', html) ]
+		html = self.chrome.get_inner_html_by_id('pagelet_timeline_medley_photos')
+		if html == None:
+			return []
+		return [ i[9:-1] for i in rfindall('ajaxify="https://www\.facebook\.com/photo\.php?[^"]*"', html) ]
+
+	def data_only(self, on):
+		'Block/unblock images, media, fonts and third party scripts for extraction passes on dataOnly'
+		if not self.options['dataOnly']:
+			return
+		if on:
+			self.chrome.block_resources(first_party=self.FIRSTPARTY)
 		else:
-			html = self.chrome.get_inner_html_by_id('pagelet_timeline_medley_photos')
-			if html != None:
-				for i in rfindall('ajaxify="https://www\.facebook\.com/photo\.php?[^"]*"', html):	# loop through photos
-					if self.chrome.stop_check():
-						return
-					self.navigate(i[9:-1])
-					self.chrome.rm_outer_html_by_id('photos_snowlift')	# show page with comments
-					path_no_ext = self.storage.modpath(account['path'], '%05d_photo' % cnt)
-					self.rm_pagelets()	# remove bluebar etc.
-					self.expand_page(
-						path_no_ext=path_no_ext,
-						limit=self.options['limitPhotos'],
-						expand=self.options['expandPhotos'],
-						translate=self.options['translatePhotos']
-					)
-					self.chrome.page_pdf(path_no_ext)
-					try:
-						self.storage.download(
-							self.ct.src(self.chrome.get_outer_html('ClassName', 'scaledImageFitWidth img')[0]),
-							account['path'],
-							'%05d_image.jpg' % cnt
-						)
-					except:
-						pass
-					cnt += 1
-					if cnt == 100000:
-						break
-					self.chrome.go_back()
+			self.chrome.unblock_resources()
+
+	def scroll_path(self, path_no_ext):
+		'Path for screenshots while scrolling through an extraction pass, empty on dataOnly - the final pdf is kept as evidence'
+		if self.options['dataOnly']:
+			return ''
+		return path_no_ext
 
+	@phase
 	def get_friends(self, account):
 		'Get friends list from given user (id or path)'
+		self.data_only(True)
+		try:
+			return self.extract_friends(account)
+		finally:
+			self.data_only(False)
+
+	def extract_friends(self, account):
+		'Get friends or members list, returns set of paths'
 		if account['type'] == 'profile':
 			self.navigate('%s/friends' % account['link'])
 			path_no_ext = self.storage.modpath(account['path'], 'friends')
-			self.rm_pagelets()	# remove bluebar etc.
-			self.rm_left()
-			self.chrome.expand_page(path_no_ext=path_no_ext)	# no limit for friends - it makes no sense not getting all friends
+			with self.chrome.batch():
+				self.rm_pagelets()	# remove bluebar etc.
+				self.rm_left()
+			self.chrome.expand_page(path_no_ext=self.scroll_path(path_no_ext))	# no limit for friends - it makes no sense not getting all friends
 			self.chrome.page_pdf(path_no_ext)
 			html = self.chrome.get_inner_html_by_id('pagelet_timeline_medley_friends')	# try to get friends
 			if html == None:
@@ -573,10 +602,11 @@ class Facebook:
 		if account['type'] == 'groups':
 			self.navigate('%s/members' % account['link'])
 			path_no_ext = self.storage.modpath(account['path'], 'members')
-			self.rm_pagelets()	# remove bluebar etc.
-			self.rm_right()
+			with self.chrome.batch():
+				self.rm_pagelets()	# remove bluebar etc.
+				self.rm_right()
 			self.chrome.set_x_left()
-			self.chrome.expand_page(path_no_ext=path_no_ext)	# no limit for friends - it makes no sense not getting all friends
+			self.chrome.expand_page(path_no_ext=self.scroll_path(path_no_ext))	# no limit for friends - it makes no sense not getting all friends
 			self.rm_left()
 			self.chrome.page_pdf(path_no_ext)
 			html = self.chrome.get_inner_html_by_id('groupsMemberBrowser')	# try to get members
@@ -592,12 +622,24 @@ class Facebook:
 			return { i['path'] for i in mlist }	# return members as set
 		return set()
 
+	@phase
 	def get_visitors(self, account):
 		'Get all visitors who left comments or likes etc. in timeline - timeline has to be open end expand'
 		self.get_timeline(account)
 		visitors = []	# list to store links to other profiles
 		visitor_ids = {account['id']}	# create set to store facebook ids of visitors to get uniq visitors
 		items = self.chrome.get_outer_html('ClassName', 'commentable_item')	# get commentable items
+		self.data_only(True)	# reaction pages are only needed for the links
+		try:
+			self.extract_visitors(items, visitors, visitor_ids)
+		finally:
+			self.data_only(False)
+		self.storage.write_2d([ [ i[j] for j in self.ACCOUNT ] for i in visitors ], account['path'], 'visitors.csv')
+		self.storage.write_json(visitors, account['path'], 'visitors.json')
+		return { i['path'] for i in visitors }	# return visitors ids as set
+
+	def extract_visitors(self, items, visitors, visitor_ids):
+		'Add visitors of commentable items and their reaction pages to the given list and set'
 		for i in items:
 			for j in rfindall('<a class="[^"]+" data-hovercard="/ajax/hovercard/user\.php\?id=[^"]+" href="[^"]+"[^>]*>[^<]+</a>', i):	# get comment authors
 				visitor = self.link2account(j)
@@ -620,9 +662,6 @@ class Facebook:
 					if visitor != None and not visitor['id'] in visitor_ids:	# uniq
 						visitors.append(visitor)
 						visitor_ids.add(visitor['id'])
-		self.storage.write_2d([ [ i[j] for j in self.ACCOUNT ] for i in visitors ], account['path'], 'visitors.csv')
-		self.storage.write_json(visitors, account['path'], 'visitors.json')
-		return { i['path'] for i in visitors }	# return visitors ids as set
 
 	def add2network(self, account, final=False):
 		'Add account with friends (and visitorson extendNetwork) to network'
@@ -644,29 +683,55 @@ class Facebook:
 		self.network[account['path']]['visitors'] = visitors
 		return friends | visitors
 
+	def save_network(self, checkpoint, account, found, target=None):
+		'Append handled account with its friends (and visitors) and the newly found profiles to the checkpoint, sets as lists for JSON'
+		entry = self.network[account['path']]
+		put = {'network': {account['path']: dict(entry, friends=list(entry['friends']), visitors=list(entry['visitors']))}}
+		if target != None:
+			put['accounts'] = {target: account}
+		checkpoint.record(put=put, extend={'old_profs': [account['path']], 'all_profs': list(found)})
+
+	@phase
 	def get_network(self, targets):
-		'Get friends and friends of friends and so on to given depth or abort if limit is reached'	
+		'Get friends and friends of friends and so on to given depth or abort if limit is reached, go on after an abort'
 		if self.options['extendNetwork']:	# on extendNetwork no extra timeline visit is needed
 			self.options['Timeline'] = False
-		accounts = {}	# set of the targeted accounts as return value for further action
-		self.network = dict()	# dictionary to store friend lists
-		old_profs = set()	# set to store profiles  that already got handled
-		all_profs = set() # set for all profiles
+		checkpoint = self.storage.checkpoint(
+			{ 'targets': targets, 'depthNetwork': self.options['depthNetwork'], 'extendNetwork': self.options['extendNetwork'] },
+			self.storage.checkpoint_name('network_checkpoint', targets)
+		)
+		accounts = checkpoint.get('accounts', dict())	# set of the targeted accounts as return value for further action
+		self.network = {	# dictionary to store friend lists
+			i: dict(j, friends=set(j['friends']), visitors=set(j['visitors'])) for i, j in checkpoint.get('network', dict()).items()
+		}
+		old_profs = set(checkpoint.get('old_profs', []))	# set to store profiles  that already got handled
+		all_profs = set(checkpoint.get('all_profs', [])) # set for all profiles
 		for i in targets:	# first get landing pages and account data of the targets
+			if i in accounts:	# done in earlier run
+				continue
 			if self.stop_check():
 				break
 			self.logger.debug('Facebook: Network: 1st loop, target: %s' % i)
 			account = self.get_landing(i)
 			accounts[i] = account	# to return later
 			old_profs.add(account['path'])	# update set of already handled profiles
-			all_profs |= self.add2network(account)
+			found = self.add2network(account)
+			all_profs |= found
+			if not self.stop_check():	# friend list is complete
+				self.save_network(checkpoint, account, found, target=i)
 		if self.options['depthNetwork'] < 1:	# on 0 only get friend list(s)
 			self.logger.debug('Facebook: Network: done after fetching friend list(s)')
+			if not self.stop_check():
+				checkpoint.remove()
 			return accounts
 		landing_cnt = 0	# to re-login after getting only landings to avoid blocking by facebook
-		for i in range(self.options['depthNetwork']):	# stay in depth limit and go through friend lists
+		for i in range(checkpoint.get('level', 0), self.options['depthNetwork']):	# stay in depth limit and go through friend lists
 			profile_cnt = 0
-			new_profs = all_profs - old_profs	# friend list which have not been handled so far
+			if checkpoint.get('level') == i and checkpoint.get('frontier') != None:	# continue level of earlier run
+				new_profs = set(checkpoint.get('frontier')) - old_profs
+			else:
+				new_profs = all_profs - old_profs	# friend list which have not been handled so far
+				checkpoint.update(level=i, frontier=list(new_profs))	# once per level
 			sum_new_profs = len(new_profs)
 			for j in new_profs:	# work on new friends
 				if self.stop_check():
@@ -683,13 +748,18 @@ class Facebook:
 					break
 				old_profs.add(account['path'])	# update set of already handled profiles
 				if i == self.options['depthNetwork'] - 1:	# on last recusion level do not get the friend lists anymore
-					all_profs |= self.add2network(account, final=True)
+					found = self.add2network(account, final=True)
 					landing_cnt += 1
 					if landing_cnt == self.NEWLOGINAFTER:
 						self.login()
 						landing_cnt = 0
 				else:
-					all_profs |= self.add2network(account)
+					found = self.add2network(account)
+				all_profs |= found
+				if not self.stop_check():
+					self.save_network(checkpoint, account, found)
+		if not self.stop_check():
+			checkpoint.remove()
 		netvis = NetVis(self.storage)	# create network visualisation object
 		friend_edges = set()	# generate edges for facebook friends excluding doubles
 		for i in self.network:
@@ -698,7 +768,7 @@ class Facebook:
 				image = '../%s/profile.jpg' % i,
 				alt_image = './pixmaps/profile.jpg',
 				label = self.network[i]['name'],
-				title = '<img src="../%s/account.png" alt="%s" style="width: 24em;"/>' % (i, i)
+				title = '<img src="../%s/account.%s" alt="%s" style="width: 24em;"/>' % (i, self.chrome.image_ext, i)
 			)
 			for j in self.network[i]['friends']:
 				if not '%s %s' % (i, j) in friend_edges:
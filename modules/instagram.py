@@ -1,16 +1,17 @@
 #!/usr/bin/env python3
 
 from re import sub as rsub
-from re import findall as rfindall
 from time import sleep
 from datetime import datetime
 from base.cutter import Cutter
 from base.logger import DEBUG
+from base.telemetry import phase
 
 class Instagram:
 	'Downloader for Instagram'
 
 	DEFAULTPAGELIMIT = 20
+	DEFAULTTABS = 1	# number of tabs to visit the posts in parallel
 
 	def __init__(self, job, storage, chrome, stop=None):
 		'Generate object for Instagram'
@@ -38,15 +39,19 @@ class Instagram:
 				l.append(i)
 		return l
 
-	def rm_banner(self):
-		'Remove redundant parts of the page'
-		self.chrome.rm_outer_html('TagName', 'nav')
-		self.chrome.rm_outer_html('TagName', 'footer')
+	def rm_banner(self, chrome=None):
+		'Remove redundant parts of the page (in the given tab)'
+		if chrome == None:
+			chrome = self.chrome
+		with chrome.batch():	# one round trip for all
+			chrome.rm_outer_html('TagName', 'nav')
+			chrome.rm_outer_html('TagName', 'footer')
 
+	@phase
 	def get_main(self, path):
 		'Scroll through main page and get images'
 		self.chrome.navigate('http://www.instagram.com/%s' % path)
-		sleep(0.5)
+		self.chrome.telemetry.sleep(0.5)
 		try:
 			name = self.chrome.get_inner_html('TagName', 'h1')[0]
 		except:
@@ -56,67 +61,110 @@ class Instagram:
 		self.storage.write_json({'name': name, 'link': 'http://www.instagram.com/%s' % path}, path, 'account.json')	# write as json file
 		try:	# try to download profile picture
 			url = self.ct.src(self.chrome.get_outer_html('TagName', 'img')[0])
-			self.storage.download(url, path, 'profile' + self.ct.ext(url))	# download media file using the right file extension
+			self.storage.download(url, path, 'profile' + self.ct.ext(url), browser=self.chrome)	# download media file using the right file extension
 		except:
 			pass
 		self.rm_banner()
 		self.chrome.set_x_center()
-		self.links = []
-		path_no_ext = self.storage.modpath(path, 'main')
-		self.chrome.expand_page(	# scroll through page and take screenshots
-			path_no_ext = path_no_ext,
-			per_page_action = self.get_links,
-			limit = self.options['limitPages']
+		self.checkpoint = self.storage.checkpoint(	# to go on after an abort
+			{ i: self.options[i] for i in ('limitPages', 'Media') },
+			path,
+			'checkpoint.json'
 		)
-		minfo = []	# list for media info
-		cnt = 1	# counter for the images/videos
-		for i in self.links:	# go through links
-			if self.chrome.stop_check():
-				break
-			self.chrome.navigate('http:www.instagram.com/%s' % i)
-			sleep(0.2)
-			self.rm_banner()
-			store_path = self.storage.modpath(path, '%05d_page' % cnt)
-			self.chrome.visible_page_png(store_path)	# save page as png
-			self.chrome.page_pdf(store_path)	# save as pdf
-			self.storage.write_text(self.chrome.get_inner_html('TagName', 'article')[0], path, '%05d_page.txt' % cnt)	# write comments
-			if self.options['Media']:
-				tags = self.chrome.get_outer_html('TagName', 'video')
-				if tags != []:
-					url = self.ct.src(tags[0])
-					ftype = 'video'
-				else:
-					tags = self.chrome.get_outer_html('TagName', 'img')
-					if len(tags) == 1:
-						url = self.ct.src(tags[0])
-						ftype = 'image'
-					elif len(tags) > 1:
-						url = self.ct.src(tags[1])
-						ftype = 'image'
-					else:
-						ftype = None
-				if ftype != None:
-					fname = '%05d_%s%s' % (cnt, ftype, self.ct.ext(url))
-					try:
-						self.storage.download(url, path, fname)	# try to download media file
-						minfo.append({	# store counter, media type and url to media info list
-							'type': ftype,
-							'file':	fname,
-							'time':	datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-							'url':	url
-						})
-					except:
-						pass
-			cnt += 1
-			if minfo != []:
-				self.storage.write_dicts(minfo,('type', 'file','time','url'), path , 'media.csv')
-				self.storage.write_json(minfo, path, 'media.json')
+		self.links = dict.fromkeys(self.checkpoint.get('links', []))	# links to the posts in order of appearance
+		if self.links == dict():	# main page has not been captured yet
+			path_no_ext = self.storage.modpath(path, 'main')
+			self.chrome.expand_page(	# scroll through page and take screenshots
+				path_no_ext = path_no_ext,
+				per_page_action = self.get_links,
+				limit = self.options['limitPages']
+			)
+			if not self.chrome.stop_check():
+				self.checkpoint.set('links', list(self.links))
+		done = set(self.checkpoint.get('done', []))	# posts visited in earlier run
+		self.minfo = [ i for i in self.checkpoint.get('media', []) if i['status'] == 'ok' ]	# media info with outcome, filled when downloads are done
+		downloaded = { i['file'] for i in self.minfo }
+		retry = [ i for i in self.checkpoint.get('queued', []) if not i['file'] in downloaded ]	# failed or not finished before the abort
+		if self.checkpoint.resumed():
+			self.checkpoint.update(media=list(self.minfo), queued=retry)
+		for i in retry:
+			self.download_media(None, path, i['file'], i['type'], i['url'])
+		posts = [ (cnt, i, path) for cnt, i in enumerate(self.links, start=1) if not cnt in done ]	# counter for the pages and images/videos
+		if self.options['parallelTabs'] > 1:	# visit posts in parallel tabs
+			pool = self.chrome.tab_pool(self.options['parallelTabs'])
+			pool.map(self.get_post, posts)
+			pool.close()
+		else:
+			for i in posts:	# go through links
+				if self.chrome.stop_check():
+					break
+				self.get_post(self.chrome, i)
+		self.storage.wait_downloads()
+		if self.minfo != []:
+			self.minfo.sort(key=lambda i: i['file'])	# downloads finish in any order
+			self.storage.write_dicts(self.minfo,('type', 'file','time','url','status','size','sha256','verified','resumed'), path , 'media.csv')
+			self.storage.write_json(self.minfo, path, 'media.json')
+		if not self.chrome.stop_check():
+			self.checkpoint.remove()
 
-	def get_links(self):
-		'Extract links from tag "article"'
+	@phase
+	def get_post(self, chrome, post):
+		'Visit one post given as (counter, link, path) with the given Chrome or Tab, queue media download'
+		cnt, link, path = post
+		chrome.navigate('http:www.instagram.com/%s' % link)
+		chrome.telemetry.sleep(0.2)
+		self.rm_banner(chrome)
+		store_path = self.storage.modpath(path, '%05d_page' % cnt)
+		chrome.visible_page_png(store_path)	# save page as png
+		chrome.page_pdf(store_path)	# save as pdf
+		self.storage.write_text(chrome.get_inner_html('TagName', 'article')[0], path, '%05d_page.txt' % cnt)	# write comments
+		if not self.options['Media']:
+			self.checkpoint.append('done', cnt)
+			return
+		tags = chrome.get_outer_html('TagName', 'video')
+		if tags != []:
+			url = self.ct.src(tags[0])
+			ftype = 'video'
+		else:
+			tags = chrome.get_outer_html('TagName', 'img')
+			if len(tags) == 1:
+				url = self.ct.src(tags[0])
+				ftype = 'image'
+			elif len(tags) > 1:
+				url = self.ct.src(tags[1])
+				ftype = 'image'
+			else:
+				self.checkpoint.append('done', cnt)
+				return
+		fname = '%05d_%s%s' % (cnt, ftype, self.ct.ext(url))
+		self.checkpoint.append_all(done=cnt, queued={'file': fname, 'type': ftype, 'url': url})	# download is retried on resume until it has an outcome
+		self.download_media(chrome, path, fname, ftype, url)
+
+	def download_media(self, chrome, path, fname, ftype, url):
+		'Queue download of media file, the outcome goes to the media info list and the checkpoint'
+		def done(fpath, error, info):
+			entry = {	# store counter, media type, url and outcome to media info list
+				'type': ftype,
+				'file':	fname,
+				'time':	datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+				'url':	url,
+				'status': 'ok' if error == None else 'failed: %s' % error,
+				'size': '',
+				'sha256': '',
+				'verified': '',
+				'resumed': ''
+			}
+			if info != None:
+				entry.update(info)
+			self.minfo.append(entry)
+			self.checkpoint.append('media', entry)
 		try:
-			for i in rfindall('<a href="/p/[^"]+', self.chrome.get_outer_html('TagName', 'article')[0]):	# go through links
-				if not i[9:] in self.links:
-					self.links.append(i[9:])
+			self.storage.download_later(url, path, fname, browser=chrome, callback=done)	# try to download media file
 		except:
 			pass
+
+	def get_links(self):
+		'Extract links from tag "article"'
+		links = self.chrome.get_new_attributes('article a[href^="/p/"]', 'href')	# only links that are new since the last step
+		if links != None:
+			self.links.update(dict.fromkeys(links))	# dict keeps order and dedupes
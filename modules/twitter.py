@@ -7,6 +7,7 @@ from time import sleep
 from datetime import datetime
 from base.cutter import Cutter
 from base.logger import DEBUG
+from base.telemetry import phase
 
 class Twitter:
 	'Downloader for Twitter'
@@ -25,8 +26,22 @@ class Twitter:
 		if self.options['Search']:	# twitter search
 			self.get_search(job['target'])
 		else:	# target userss / twitter user
-			for i in self.extract_targets(job['target']):				
+			targets = self.extract_targets(job['target'])
+			checkpoint = self.storage.checkpoint(	# accounts that are done, to go on after an abort
+				{ 'targets': targets, 'limitPages': self.options['limitPages'], 'Photos': self.options['Photos'] },
+				self.storage.checkpoint_name('checkpoint', targets)
+			)
+			for i in targets:
+				if i in checkpoint.get('done', []):
+					self.logger.info('Twitter: %s has been done in an earlier run' % i)
+					continue
+				if self.chrome.stop_check():
+					break
 				self.get_account(i)
+				if not self.chrome.stop_check():
+					checkpoint.append('done', i)
+			if not self.chrome.stop_check():
+				checkpoint.remove()
 		if self.logger.level < DEBUG:
 			self.logger.visible('Twitter: finished, now sleeping for 5 seconds until closing browser')
 			sleep(5)
@@ -45,16 +60,18 @@ class Twitter:
 
 	def rm_banner(self):
 		'Remove redundant parts of the page'
-		self.chrome.rm_outer_html('ClassName', 'topbar js-topbar')
-		self.chrome.rm_outer_html('ClassName', 'topbar-spacer')
-		self.chrome.rm_outer_html('ClassName', 'BannnersContainer')
-		self.chrome.rm_outer_html('ClassName', 'Bannner eu-cookie-notice')
-		self.chrome.rm_outer_html('ClassName', 'MoveableModule')
+		with self.chrome.batch():	# one round trip for all
+			self.chrome.rm_outer_html('ClassName', 'topbar js-topbar')
+			self.chrome.rm_outer_html('ClassName', 'topbar-spacer')
+			self.chrome.rm_outer_html('ClassName', 'BannnersContainer')
+			self.chrome.rm_outer_html('ClassName', 'Bannner eu-cookie-notice')
+			self.chrome.rm_outer_html('ClassName', 'MoveableModule')
 
 	def rm_profile_canopy(self):
 		'Remove general infos from profile'
-		self.chrome.rm_outer_html('ClassName', 'ProfileCanopy ProfileCanopy--withNav ProfileCanopy--large js-variableHeightTopBar')
-		self.chrome.rm_outer_html('ClassName', 'Grid-cell')
+		with self.chrome.batch():
+			self.chrome.rm_outer_html('ClassName', 'ProfileCanopy ProfileCanopy--withNav ProfileCanopy--large js-variableHeightTopBar')
+			self.chrome.rm_outer_html('ClassName', 'Grid-cell')
 
 	def rm_search(self):
 		'Remove search filters etc.'
@@ -63,6 +80,7 @@ class Twitter:
 		if m != None:
 			self.chrome.set_outer_html('ClassName', m.group()[12:], 0, '')
 
+	@phase
 	def get_tweets(self, path):
 		'Get Tweets by scrolling down.'
 		path_no_ext = self.storage.modpath(path, 'tweets')
@@ -70,29 +88,36 @@ class Twitter:
 		self.chrome.page_pdf(path_no_ext)
 		if self.options['Photos']:
 			cnt = 1
-			pinfo = []	# to store urls
+			pinfo = []	# to store urls, filled when downloads are done
 			for html in self.chrome.get_outer_html('TagName', 'img'):	# get all embeded media
 				if rsearch('class="avatar', html) == None and rsearch('class="Emoji', html) == None:
 					url = self.ct.src(html)
 					fname = 'photo_%05d%s' % (cnt, self.ct.ext(url))
+					def done(fpath, error, info, fname=fname, url=url):
+						if error == None:
+							pinfo.append({	# store counter, media type, url and checksum to media info list
+								'file':	fname,
+								'time':	datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+								'url':	url,
+								'size': info['size'],
+								'sha256': info['sha256']
+							})
 					try:	# try to download photo
-						self.storage.download(url, path, fname)
+						self.storage.download_later(url, path, fname, browser=self.chrome, callback=done)
 					except:
 						continue
 					cnt += 1
-					pinfo.append({	# store counter, media type and url to media info list
-						'file':	fname,
-						'time':	datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-						'url':	url
-					})
+			self.storage.wait_downloads()
 			if pinfo != []:
-				self.storage.write_dicts(pinfo, ('file','time','url') , path, 'photos.csv')
+				pinfo.sort(key=lambda i: i['file'])	# downloads finish in any order
+				self.storage.write_dicts(pinfo, ('file','time','url','size','sha256') , path, 'photos.csv')
 				self.storage.write_json(pinfo, path, 'photos.json')
 
+	@phase
 	def get_account(self, path):
 		'Get tweets of an account / Twitter user'
 		self.chrome.navigate('http://twitter.com/%s' % path)
-		sleep(1)
+		self.chrome.telemetry.sleep(1)
 		self.rm_banner()
 		self.logger.info('Twitter: Data will be stored to %s' % self.storage.mksubdir(path))
 		path_no_ext = self.storage.modpath(path, 'account')
@@ -101,10 +126,11 @@ class Twitter:
 		self.rm_profile_canopy()
 		self.get_tweets(path)
 
+	@phase
 	def get_search(self, target):
 		'On Search the target is handled as Twitter search string'
 		self.chrome.navigate('https://twitter.com/search?f=tweets&vertical=news&q=%s&src=typd' % target)
-		sleep(1)
+		self.chrome.telemetry.sleep(1)
 		path = 'search_'	# handable directory name
 		if len(target) > 23:
 			path += target.replace(' ', '_')[:23]